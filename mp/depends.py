@@ -0,0 +1,156 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import os
+import ast
+import logging
+
+# where MicroPython looks for modules, relative to the project root
+SEARCH_PATH = ["", "lib"]
+
+
+def _find_module(root, name):
+    """
+    :return:            local files making up the module (package __init__
+                        files included), or None if it is not part of the tree
+    """
+
+    for path in SEARCH_PATH:
+
+        base = os.path.join(root, path)
+        parts = name.split(".")
+        files = []
+
+        for i in range(len(parts) - 1):
+            init = os.path.join(base, *(parts[:i + 1] + ["__init__.py"]))
+            if os.path.isfile(init):
+                files.append(init)
+            elif not os.path.isdir(os.path.join(base, *parts[:i + 1])):
+                break
+        else:
+            module = os.path.join(base, *parts)
+            if os.path.isfile(module + ".py"):
+                return files + [module + ".py"]
+            if os.path.isfile(os.path.join(module, "__init__.py")):
+                return files + [os.path.join(module, "__init__.py")]
+
+    return None
+
+
+def _module_name(root, path):
+
+    rel = os.path.relpath(path, root)
+
+    for p in sorted(SEARCH_PATH, key=len, reverse=True):
+        if len(p) and rel.startswith(p + os.sep):
+            rel = rel[len(p) + 1:]
+            break
+
+    name = os.path.splitext(rel)[0].replace(os.sep, ".")
+
+    if name.endswith(".__init__"):
+        return name[:-9], True
+
+    return name, False
+
+
+def imported_names(path, module, is_package):
+    """
+    :param path:        python source file
+    :param module:      dotted name of the module
+    :param is_package:  True if path is a package __init__.py
+    :return:            absolute names of all modules the file may import,
+                        including imports inside functions and try blocks
+    """
+
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), path)
+
+    package = module if is_package else module.rpartition(".")[0]
+    names = set()
+
+    for node in ast.walk(tree):
+
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                names.add(alias.name)
+
+        elif isinstance(node, ast.ImportFrom):
+
+            if node.level:
+                base = package.split(".") if len(package) else []
+                base = base[:len(base) - node.level + 1]
+                prefix = ".".join(base + ([node.module] if node.module else []))
+            else:
+                prefix = node.module
+
+            if prefix:
+                names.add(prefix)
+
+            # "from pkg import mod" may import a sub-module
+            for alias in node.names:
+                if alias.name != "*":
+                    names.add(prefix + "." + alias.name if prefix else alias.name)
+
+    return names
+
+
+def reachable(root, entry):
+    """
+    Collect all local modules reachable from an entry script by following
+    its imports. Modules outside the tree (built-ins, frozen modules) are
+    ignored.
+
+    :param root:        project directory
+    :param entry:       entry script, e.g. main.py
+    :return:            sorted list of local files, entry included
+    """
+
+    root = os.path.abspath(root)
+    entry = os.path.abspath(os.path.join(root, entry))
+
+    if not os.path.isfile(entry):
+        raise IOError("No such entry script: %s" % entry)
+
+    found = set([entry])
+    todo = [entry]
+
+    while len(todo):
+
+        path = todo.pop()
+        module, is_package = _module_name(root, path)
+
+        try:
+            names = imported_names(path, module, is_package)
+        except SyntaxError as e:
+            logging.warning("unable to parse %s: %s" % (path, e))
+            continue
+
+        for name in names:
+            for f in _find_module(root, name) or []:
+                if f not in found:
+                    found.add(f)
+                    todo.append(f)
+
+    return sorted(found)
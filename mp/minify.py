@@ -0,0 +1,189 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import io
+import os
+import ast
+import hashlib
+import logging
+import tokenize
+
+# minified files are kept here, named after the hash of their source
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".mpfshell_min")
+
+# bump when the output of minify() changes, so old cache entries are ignored
+VERSION = 1
+
+_SKIP = (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER)
+
+
+def _docstrings(tree):
+
+    found = set()
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if len(body) and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                found.add((body[0].lineno, body[0].col_offset))
+
+    return found
+
+
+def _word(c):
+    return c.isalnum() or c == "_"
+
+
+def minify(source):
+    """
+    Strip comments and docstrings and reduce indentation to one space per
+    level. Every statement stays on its original line, so line numbers in
+    tracebacks still match the source. Docstrings become "pass".
+
+    :param source:      python source code
+    :return:            minified source code
+    """
+
+    docstrings = _docstrings(ast.parse(source))
+    lines = source.splitlines(True)
+    tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+
+    out = []
+    row = 1
+    indent = 0
+    depth = 0
+    line_start = True
+    in_docstring = False
+    last = ""
+    i = 0
+
+    while i < len(tokens):
+
+        kind, text, start, end, _ = tokens[i]
+        i += 1
+
+        if kind == tokenize.INDENT:
+            indent += 1
+        elif kind == tokenize.DEDENT:
+            indent -= 1
+        elif kind == tokenize.NEWLINE:
+            line_start = True
+            in_docstring = False
+
+        if kind in _SKIP:
+            continue
+
+        if in_docstring and kind == tokenize.STRING:
+            continue
+
+        if kind == getattr(tokenize, "FSTRING_START", None):
+            # copy f-strings (python >= 3.12 splits them up) verbatim
+            nesting = 1
+            while nesting:
+                nesting += {tokenize.FSTRING_START: 1, tokenize.FSTRING_END: -1}.get(tokens[i][0], 0)
+                end = tokens[i][3]
+                i += 1
+            if start[0] == end[0]:
+                text = lines[start[0] - 1][start[1]:end[1]]
+            else:
+                text = lines[start[0] - 1][start[1]:] + "".join(lines[start[0]:end[0] - 1]) + \
+                       lines[end[0] - 1][:end[1]]
+
+        if line_start and (start[0], start[1]) in docstrings:
+            in_docstring = True
+            text = "pass" + "\n" * (end[0] - start[0])
+
+        if start[0] > row:
+            if line_start:
+                out.append("\n" * (start[0] - row))
+            elif depth:
+                out.append("\n" * (start[0] - row))
+            else:
+                out.append("\\\n" * (start[0] - row))
+            row = start[0]
+            if line_start:
+                out.append(" " * indent)
+        elif line_start and not len(out):
+            out.append(" " * indent)
+        elif not line_start and len(last) and (_word(last[-1]) and (_word(text[0]) or text[0] in "'\"")
+                                              or last[-1] == "." and text[0] == "."):
+            out.append(" ")
+        elif not line_start and kind == tokenize.NUMBER and last[-1:] == ".":
+            out.append(" ")
+
+        if kind == tokenize.OP:
+            if text in "([{":
+                depth += 1
+            elif text in ")]}":
+                depth -= 1
+
+        out.append(text)
+        row = end[0]
+        last = text
+        line_start = False
+
+    out.append("\n" * (len(lines) - row + 1) if len(lines) >= row else "\n")
+
+    return "".join(out)
+
+
+def minify_file(src, cache=True):
+    """
+    Minify a python file, reusing cached results for unchanged sources.
+    If the source is not UTF-8 or the minified code does not compile, the
+    source is used as it is.
+
+    :param src:         python source file
+    :param cache:       use the minify cache
+    :return:            name of the (cached) minified file
+    """
+
+    with open(src, "rb") as f:
+        data = f.read()
+
+    digest = hashlib.sha256(data + b"\0" + str(VERSION).encode("utf-8")).hexdigest()
+    dst = os.path.join(CACHE_DIR, digest + ".py")
+
+    if cache and os.path.isfile(dst):
+        return dst
+
+    try:
+        result = minify(data.decode("utf-8"))
+        compile(result, src, "exec")
+        result = result.encode("utf-8")
+    except (SyntaxError, tokenize.TokenError, ValueError) as e:
+        # UnicodeDecodeError is a ValueError
+        logging.warning("not minifying %s: %s" % (src, e))
+        result = data
+
+    if not os.path.isdir(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+
+    tmp = "%s.%d" % (dst, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(result)
+    os.rename(tmp, dst)
+
+    return dst
@@ -0,0 +1,275 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import os
+import errno
+import binascii
+import logging
+
+from mp.pyboard import PyboardError
+
+# A request from the device starts with this byte on its stdout, followed by
+# a command character and its arguments up to a newline. The host answers on
+# the device's stdin with a single line, binary data is always hex encoded.
+MOUNT_ESCAPE = b'\x18'
+
+MOUNT_POINT = "/remote"
+
+# device side of the mount: a VFS object forwarding all calls to the host
+FS_HOOK = (
+    "import io\r\n"
+    "def _rl():\r\n"
+    "  l = ''\r\n"
+    "  while True:\r\n"
+    "    c = sys.stdin.read(1)\r\n"
+    "    if c == '\\n':\r\n"
+    "      return l\r\n"
+    "    l += c\r\n"
+    "def _rq(c, a):\r\n"
+    "  sys.stdout.write('\\x18' + c + a + '\\n')\r\n"
+    "  l = _rl()\r\n"
+    "  if l.startswith('-'):\r\n"
+    "    raise OSError(-int(l))\r\n"
+    "  return l\r\n"
+    "def _rd(n):\r\n"
+    "  return ubinascii.unhexlify(sys.stdin.read(2 * n)) if n else b''\r\n"
+    "class _RF(io.IOBase):\r\n"
+    "  def __init__(s, fd, t):\r\n"
+    "    s.fd = fd\r\n"
+    "    s.t = t\r\n"
+    "  def __enter__(s):\r\n"
+    "    return s\r\n"
+    "  def __exit__(s, a, b, c):\r\n"
+    "    s.close()\r\n"
+    "  def __iter__(s):\r\n"
+    "    return s\r\n"
+    "  def __next__(s):\r\n"
+    "    l = s.readline()\r\n"
+    "    if not l:\r\n"
+    "      raise StopIteration\r\n"
+    "    return l\r\n"
+    "  def ioctl(s, r, a):\r\n"
+    "    if r == 4:\r\n"
+    "      s.close()\r\n"
+    "    return 0\r\n"
+    "  def readinto(s, b):\r\n"
+    "    d = _rd(int(_rq('r', '%d %d' % (s.fd, len(b)))))\r\n"
+    "    b[:len(d)] = d\r\n"
+    "    return len(d)\r\n"
+    "  def read(s, n=-1):\r\n"
+    "    r = b''\r\n"
+    "    while n:\r\n"
+    "      d = _rd(int(_rq('r', '%d %d' % (s.fd, n))))\r\n"
+    "      if not d:\r\n"
+    "        break\r\n"
+    "      r += d\r\n"
+    "      if n > 0:\r\n"
+    "        n -= len(d)\r\n"
+    "    return r.decode() if s.t else r\r\n"
+    "  def readline(s):\r\n"
+    "    d = _rd(int(_rq('L', '%d' % s.fd)))\r\n"
+    "    return d.decode() if s.t else d\r\n"
+    "  def readlines(s):\r\n"
+    "    return [l for l in s]\r\n"
+    "  def write(s, d):\r\n"
+    "    if s.t:\r\n"
+    "      d = d.encode()\r\n"
+    "    return int(_rq('w', '%d %s' % (s.fd, ubinascii.hexlify(d).decode())))\r\n"
+    "  def close(s):\r\n"
+    "    if s.fd >= 0:\r\n"
+    "      _rq('c', '%d' % s.fd)\r\n"
+    "      s.fd = -1\r\n"
+    "class _FS:\r\n"
+    "  def mount(s, r, m):\r\n"
+    "    s.cwd = '/'\r\n"
+    "  def umount(s):\r\n"
+    "    pass\r\n"
+    "  def _p(s, p):\r\n"
+    "    return p if p.startswith('/') else s.cwd.rstrip('/') + '/' + p\r\n"
+    "  def chdir(s, p):\r\n"
+    "    p = s._p(p)\r\n"
+    "    if not s.stat(p)[0] & 0x4000:\r\n"
+    "      raise OSError(20)\r\n"
+    "    s.cwd = p\r\n"
+    "  def getcwd(s):\r\n"
+    "    return s.cwd\r\n"
+    "  def ilistdir(s, p):\r\n"
+    "    n = int(_rq('l', s._p(p)))\r\n"
+    "    e = []\r\n"
+    "    for i in range(n):\r\n"
+    "      t, z, f = _rl().split(' ', 2)\r\n"
+    "      e.append((f, int(t), 0, int(z)))\r\n"
+    "    return iter(e)\r\n"
+    "  def stat(s, p):\r\n"
+    "    m, z, t = _rq('s', s._p(p)).split()\r\n"
+    "    return (int(m), 0, 0, 0, 0, 0, int(z), int(t), int(t), int(t))\r\n"
+    "  def statvfs(s, p):\r\n"
+    "    return (0, 0, 0, 0, 0, 0, 0, 0, 0, 255)\r\n"
+    "  def open(s, p, m):\r\n"
+    "    return _RF(int(_rq('o', '%s %s' % (m, s._p(p)))), 'b' not in m)\r\n"
+    "  def mkdir(s, p):\r\n"
+    "    _rq('m', s._p(p))\r\n"
+    "  def rmdir(s, p):\r\n"
+    "    _rq('d', s._p(p))\r\n"
+    "  def remove(s, p):\r\n"
+    "    _rq('x', s._p(p))\r\n"
+    "  def rename(s, a, b):\r\n"
+    "    _rq('n', '%s\\x00%s' % (s._p(a), s._p(b)))\r\n"
+)
+
+
+class MountServer(object):
+
+    # upper limit of data bytes sent per read reply (device stdin buffers are small)
+    MAX_READ = 256
+
+    def __init__(self, root):
+        """
+        Serve a local directory to the device. The server is called from
+        Pyboard.read_until whenever the device sends MOUNT_ESCAPE.
+
+        :param root:        local directory to serve
+        """
+
+        self.root = os.path.abspath(root)
+        self.files = {}
+        self.next_fd = 0
+
+    def __local(self, path):
+
+        local = os.path.normpath(os.path.join(self.root, path.lstrip("/")))
+
+        if local != self.root and not local.startswith(self.root + os.sep):
+            raise OSError(errno.EACCES, "outside of mount: %s" % path)
+
+        return local
+
+    def __file(self, fd):
+
+        if int(fd) not in self.files:
+            raise OSError(errno.EBADF, "bad file descriptor: %s" % fd)
+
+        return self.files[int(fd)]
+
+    def __reply_data(self, data):
+
+        return "%d\n%s" % (len(data), binascii.hexlify(data).decode("utf-8"))
+
+    def __request(self, cmd, arg):
+
+        if cmd == "s":
+            st = os.stat(self.__local(arg))
+            mode = 0x4000 if os.path.isdir(self.__local(arg)) else 0x8000
+            return "%d %d %d\n" % (mode, st.st_size, st.st_mtime)
+
+        elif cmd == "l":
+            path = self.__local(arg)
+            names = os.listdir(path)
+            reply = "%d\n" % len(names)
+            for n in names:
+                full = os.path.join(path, n)
+                if os.path.isdir(full):
+                    reply += "%d 0 %s\n" % (0x4000, n)
+                else:
+                    reply += "%d %d %s\n" % (0x8000, os.path.getsize(full), n)
+            return reply
+
+        elif cmd == "o":
+            mode, path = arg.split(" ", 1)
+            mode = mode.replace("t", "")
+            if "b" not in mode:
+                mode += "b"
+            self.files[self.next_fd] = open(self.__local(path), mode)
+            self.next_fd += 1
+            return "%d\n" % (self.next_fd - 1)
+
+        elif cmd == "r":
+            fd, size = arg.split(" ")
+            size = int(size)
+            if size < 0 or size > self.MAX_READ:
+                size = self.MAX_READ
+            return self.__reply_data(self.__file(fd).read(size))
+
+        elif cmd == "L":
+            return self.__reply_data(self.__file(arg).readline())
+
+        elif cmd == "w":
+            fd, data = arg.split(" ")
+            return "%d\n" % self.__file(fd).write(binascii.unhexlify(data))
+
+        elif cmd == "c":
+            self.__file(arg).close()
+            del self.files[int(arg)]
+            return "0\n"
+
+        elif cmd == "m":
+            os.mkdir(self.__local(arg))
+            return "0\n"
+
+        elif cmd == "d":
+            os.rmdir(self.__local(arg))
+            return "0\n"
+
+        elif cmd == "x":
+            os.remove(self.__local(arg))
+            return "0\n"
+
+        elif cmd == "n":
+            src, dst = arg.split("\0")
+            os.rename(self.__local(src), self.__local(dst))
+            return "0\n"
+
+        raise OSError(errno.EINVAL, "unknown request: %s" % cmd)
+
+    def handle(self, pyb):
+        """
+        Serve one request. MOUNT_ESCAPE was already read from the connection.
+
+        :param pyb:         Pyboard whose connection carries the request
+        """
+
+        line = b""
+
+        while not line.endswith(b"\n"):
+            c = pyb.con.read(1)
+            if not len(c):
+                raise PyboardError("timeout waiting for mount request")
+            line += c
+
+        line = line[:-1].decode("utf-8")
+
+        try:
+            reply = self.__request(line[:1], line[1:])
+        except (IOError, OSError) as e:
+            logging.debug("mount request '%s' failed: %s" % (line, e))
+            reply = "-%d\n" % (e.errno or errno.EIO)
+
+        pyb.con.write(reply.encode("utf-8"))
+
+    def close(self):
+
+        for f in self.files.values():
+            f.close()
+
+        self.files = {}
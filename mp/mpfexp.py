@@ -30,16 +30,17 @@ import sre_constants
 import binascii
 import getpass
 import logging
-import subprocess
 import ast
+import time
+import json
+import hashlib
 
 from mp.pyboard import Pyboard
 from mp.pyboard import PyboardError
-from mp.conserial import ConSerial
-from mp.contelnet import ConTelnet
-from mp.conwebsock import ConWebsock
 from mp.conbase import ConError
 from mp.retry import retry
+from mp.mount import MountServer, MOUNT_ESCAPE, MOUNT_POINT, FS_HOOK
+from mp.progress import Progress
 
 
 def _was_file_not_existing(exception):
@@ -57,6 +58,15 @@ def _was_file_not_existing(exception):
     return any(err in stre for err in ('ENOENT', 'ENODEV', 'EINVAL', 'OSError:'))
 
 
+def _sha256(path):
+    """
+    :return:                hex SHA256 of a local file
+    """
+
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
 class RemoteIOError(IOError):
     pass
 
@@ -64,8 +74,21 @@ class RemoteIOError(IOError):
 class MpFileExplorer(Pyboard):
 
     BIN_CHUNK_SIZE = 64 * 100
+    MIN_CHUNK_SIZE = 64 * 4
+    MAX_CHUNK_SIZE = 64 * 512
     MAX_TRIES = 3
 
+    # chunk sizes found for each device are remembered across sessions
+    CHUNK_SIZE_FILE = os.path.join(os.path.expanduser("~"), ".mpfshell_chunks.json")
+
+    # pipelined uploads stream hex data into a receiver loop running on the
+    # device without waiting for acknowledgements, the flow control of the
+    # link (USB-CDC, TCP) keeps its stdin buffer from overflowing; the
+    # receiver reads PIPE_BLOCK_SIZE bytes at a time and reports the number
+    # of bytes written once at the end
+    PIPE_BLOCK_SIZE = 1024
+    PIPE_TIMEOUT = 10
+
     def __init__(self, constr, reset=False):
         """
         Supports the following connection strings.
@@ -86,6 +109,14 @@ class MpFileExplorer(Pyboard):
 
         self.dir = None
         self.sysname = None
+        self.device_id = None
+        self.mount_server = None
+        self.writer_defined = False
+        self.chunk_size = self.BIN_CHUNK_SIZE
+        self.max_chunk_size = self.BIN_CHUNK_SIZE
+        self.__chunk_rate = None
+        # set progress.callback to follow transfers
+        self.progress = Progress()
         self.setup()
 
     def __del__(self):
@@ -115,6 +146,8 @@ class MpFileExplorer(Pyboard):
             else:
                 baudrate = 115200
 
+            # transports are imported on demand, each pulls in its own libraries
+            from mp.conserial import ConSerial
             con = ConSerial(port=port, baudrate=baudrate, reset=self.reset)
 
         elif proto.strip(" ") == "tn":
@@ -133,6 +166,7 @@ class MpFileExplorer(Pyboard):
                 passwd = getpass.getpass("telnet passwd: ")
 
             # print("telnet connection to: %s, %s, %s" % (host, login, passwd))
+            from mp.contelnet import ConTelnet
             con = ConTelnet(ip=host, user=login, password=passwd)
 
         elif proto.strip(" ") == "ws":
@@ -144,6 +178,7 @@ class MpFileExplorer(Pyboard):
             else:
                 passwd = getpass.getpass("webrepl passwd: ")
 
+            from mp.conwebsock import ConWebsock
             con = ConWebsock(host, passwd)
 
         return con
@@ -155,8 +190,186 @@ class MpFileExplorer(Pyboard):
     def __set_sysname(self):
         self.sysname = self.eval("os.uname()[0]").decode('utf-8')
 
+    def __probe_chunk_size(self):
+
+        # heap and id are probed in one go, a chunk needs about 8 times its
+        # size on the heap (raw REPL buffer, hex string, decoded bytes)
+        ret = self.exec_(
+            "gc.collect()\r\n"
+            "try:\r\n"
+            "  import machine\r\n"
+            "  i = ubinascii.hexlify(machine.unique_id()).decode()\r\n"
+            "except Exception:\r\n"
+            "  i = os.uname()[0]\r\n"
+            "print(gc.mem_free(), i)\r\n"
+            "del i\r\n"
+        ).decode("utf-8").split()
+
+        mem_free = int(ret[0])
+        self.device_id = ret[1] if len(ret) > 1 else self.sysname
+
+        self.max_chunk_size = max(self.MIN_CHUNK_SIZE,
+                                  min(self.MAX_CHUNK_SIZE, mem_free // 8 // 64 * 64))
+
+        try:
+            with open(self.CHUNK_SIZE_FILE) as f:
+                remembered = json.load(f).get(self.device_id)
+        except (IOError, ValueError):
+            remembered = None
+
+        if remembered is None:
+            remembered = self.BIN_CHUNK_SIZE
+
+        self.chunk_size = max(self.MIN_CHUNK_SIZE, min(self.max_chunk_size, remembered))
+        logging.info("chunk size for %s: %d (max %d)" % (self.device_id, self.chunk_size, self.max_chunk_size))
+
+    def __save_chunk_size(self):
+
+        if self.device_id is None:
+            return
+
+        try:
+            try:
+                with open(self.CHUNK_SIZE_FILE) as f:
+                    sizes = json.load(f)
+            except (IOError, ValueError):
+                sizes = {}
+
+            if sizes.get(self.device_id) != self.chunk_size:
+                sizes[self.device_id] = self.chunk_size
+                with open(self.CHUNK_SIZE_FILE, "w") as f:
+                    json.dump(sizes, f)
+
+        except Exception as e:
+            # also called from __del__, possibly during interpreter shutdown
+            logging.warning("failed to save chunk size: %s" % e)
+
+    def __tune_chunk_size(self, size, secs):
+
+        # simple hill climbing on the measured throughput: keep growing as
+        # long as bigger chunks are not slower, step back once they are
+        if secs <= 0:
+            return
+
+        rate = size / secs
+
+        if self.__chunk_rate is None or rate >= self.__chunk_rate * 0.95:
+            self.chunk_size = min(self.max_chunk_size, size * 5 // 4 // 64 * 64)
+        else:
+            self.chunk_size = max(self.MIN_CHUNK_SIZE, size * 4 // 5 // 64 * 64)
+
+        self.__chunk_rate = rate
+
+    def _define_writer(self):
+        """
+        Define the buffered writer class _W on the device (once per session).
+        The writer collects data in a preallocated buffer of the file system
+        block size and only writes whole blocks, which avoids read-modify-write
+        cycles on littlefs and FAT.
+        """
+
+        if not self.writer_defined:
+            self.exec_(
+                "class _W:\r\n"
+                "  def __init__(s, p):\r\n"
+                "    try:\r\n"
+                "      n = os.statvfs(p[:p.rfind('/')] or '/')[0]\r\n"
+                "    except Exception:\r\n"
+                "      n = 0\r\n"
+                "    if n <= 0:\r\n"
+                "      n = 512\r\n"
+                "    try:\r\n"
+                "      s.b = bytearray(n)\r\n"
+                "    except MemoryError:\r\n"
+                "      gc.collect()\r\n"
+                "      s.b = bytearray(n)\r\n"
+                "    s.m = memoryview(s.b)\r\n"
+                "    s.n = 0\r\n"
+                "    s.f = open(p, 'wb')\r\n"
+                "  def write(s, d):\r\n"
+                "    d = memoryview(d)\r\n"
+                "    while len(d):\r\n"
+                "      k = min(len(d), len(s.b) - s.n)\r\n"
+                "      s.m[s.n:s.n + k] = d[:k]\r\n"
+                "      s.n += k\r\n"
+                "      d = d[k:]\r\n"
+                "      if s.n == len(s.b):\r\n"
+                "        s.f.write(s.b)\r\n"
+                "        s.n = 0\r\n"
+                "  def close(s):\r\n"
+                "    if s.n:\r\n"
+                "      s.f.write(s.m[:s.n])\r\n"
+                "    s.f.close()\r\n"
+                "    s.m = s.b = None\r\n"
+            )
+            self.writer_defined = True
+
+    def _open_writer(self, name):
+        """
+        Open a remote file as "f" for writing through the buffered writer.
+
+        :param name:        remote file name
+        """
+
+        self._define_writer()
+        self.exec_("f = _W('%s')" % self._fqn(name))
+
+    def _send_chunks(self, data, call, verbose=True, name=None):
+        """
+        Send data to the device in hex encoded chunks, passing every chunk to
+        the given callable (e.g. "f.write"). The chunk size adapts to the
+        measured throughput and shrinks when the device runs out of memory.
+
+        :param data:        bytes to send
+        :param call:        name of the callable on the device
+        :param verbose:     report the transfer progress
+        :param name:        what is transferred, shown with the progress
+        """
+
+        if verbose:
+            self.progress.start(name or call, len(data))
+
+        try:
+            self.__send_chunks(data, call, verbose)
+        finally:
+            if verbose:
+                self.progress.finish()
+
+    def __send_chunks(self, data, call, verbose):
+
+        file_size = len(data)
+        pos = 0
+
+        while pos < file_size:
+
+            size = self.chunk_size
+            c = binascii.hexlify(data[pos:pos + size])
+
+            start = time.time()
+
+            try:
+                self.exec_("%s(ubinascii.unhexlify('%s'))" % (call, c.decode('utf-8')))
+            except PyboardError as e:
+                if "MemoryError" in str(e) and size > self.MIN_CHUNK_SIZE:
+                    # nothing was written, retry the same data in a smaller chunk
+                    self.chunk_size = self.max_chunk_size = max(self.MIN_CHUNK_SIZE, size // 2 // 64 * 64)
+                    self.__chunk_rate = None
+                    logging.info("MemoryError, chunk size reduced to %d" % self.chunk_size)
+                    self.exec_("gc.collect()")
+                    continue
+                raise e
+
+            if len(c) == 2 * size:
+                self.__tune_chunk_size(size, time.time() - start)
+
+            pos += size
+
+            if verbose:
+                self.progress.update(min(pos, file_size))
+
     def close(self):
 
+        self.__save_chunk_size()
         Pyboard.close(self)
         self.dir = None
 
@@ -167,16 +380,56 @@ class MpFileExplorer(Pyboard):
 
     def setup(self):
 
+        # a soft reset or reconnect drops the mount on the device
+        self.__drop_mount()
+
         self.enter_raw_repl()
+        self.__init_session()
+
+        self.__set_sysname()
+        self.__probe_chunk_size()
+
+    def __init_session(self):
+        """
+        Set up the device namespace, which is lost on every soft reset.
+        """
+
 #         self.exec_("import sys, ubinascii, os\r\n")
-        self.exec_("import sys, ubinascii\r\nimport uos as os\r\n")
+        self.exec_("import sys, ubinascii, gc\r\nimport uos as os\r\n")
 
         # New version mounts files on /flash so lets set dir based on where we are in
         # filesystem.
         # Using the "path.join" to make sure we get "/" if "os.getcwd" returns "".
         self.dir = posixpath.join("/", self.eval("os.getcwd()").decode('utf8'))
+        self.writer_defined = False
 
-        self.__set_sysname()
+    def resume(self):
+        """
+        Get back into the raw REPL after user code ran, without reopening
+        the connection. If the board went through a soft reset meanwhile,
+        only the device namespace is set up again.
+
+        :return:            True if the board was reset
+        """
+
+        # ctrl-C drops a pending line, ctrl-A (re)enters the raw REPL from
+        # either REPL mode and answers with the banner right away
+        self.con.write(b'\r\x03\x01')
+        data = self.read_until(1, b'raw REPL; CTRL-B to exit', timeout=1)
+
+        if not data.endswith(b'raw REPL; CTRL-B to exit'):
+            # still booting or stuck, take the long way
+            self.enter_raw_repl()
+
+        if self.eval("'ubinascii' in globals()") == b'True':
+            return False
+
+        logging.info("board was reset, restoring session")
+
+        self.__drop_mount()
+        self.__init_session()
+
+        return True
 
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
     def ls(self, add_files=True, add_dirs=True, add_details=False):
@@ -260,20 +513,146 @@ class MpFileExplorer(Pyboard):
                 else:
                     raise e
 
+    def rmtree(self, target):
+        """
+        Delete a remote file, or a directory with everything below it. The
+        tree is walked and deleted on the device within a single exec, which
+        may take long and is neither timed out nor retried (not idempotent).
+
+        :param target:      remote file or directory
+        :return:            (number of files removed, number of directories removed)
+        """
+
+        path = self._fqn(target)
+
+        try:
+
+            lines = self._stream_lines(
+                "def _rmr(p):\r\n"
+                "  if not os.stat(p)[0] & 0x4000:\r\n"
+                "    os.remove(p)\r\n"
+                "    return 1, 0\r\n"
+                "  f = d = 0\r\n"
+                "  for n in os.listdir(p):\r\n"
+                "    a, b = _rmr(p.rstrip('/') + '/' + n)\r\n"
+                "    f += a\r\n"
+                "    d += b\r\n"
+                "  if p != '/':\r\n"
+                "    os.rmdir(p)\r\n"
+                "    d += 1\r\n"
+                "  return f, d\r\n"
+                "try:\r\n"
+                "  print('%%d %%d' %% _rmr('%s'))\r\n"
+                "finally:\r\n"
+                "  del _rmr\r\n" % path
+            )
+
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("No such file or directory: %s" % target)
+            elif "EACCES" in str(e) or "EPERM" in str(e):
+                raise RemoteIOError("Permission denied while removing: %s" % target)
+            else:
+                raise e
+
+        files, dirs = lines[-1].split()
+
+        return int(files), int(dirs)
+
     def mrm(self, pat, verbose=False):
+        """
+        Delete all files in the current remote directory matching a regular
+        expression. Listing and deleting take one exec each, no matter how
+        many files match.
+
+        :param pat:         regular expression (matched against the file name)
+        :return:            list of deleted files
+        """
+
+        ret = self.exec_(
+            "for n in os.listdir('%s'):\r\n"
+            "  if not os.stat('%s' + n)[0] & 0x4000:\r\n"
+            "    print(n)\r\n" % (self.dir, self.dir.rstrip("/") + "/")
+        )
 
-        files = self.ls(add_dirs=False)
         find = re.compile(pat)
+        files = [f for f in ret.decode("utf-8").splitlines() if len(f) and find.match(f)]
 
-        for f in files:
-            if find.match(f):
-                if verbose:
-                    print(" * rm %s" % f)
+        if not len(files):
+            return files
+
+        if verbose:
+            for f in files:
+                print(" * rm %s" % f)
+
+        # no idle timeout, deleting thousands of files takes a while
+        self._stream_lines(
+            "for n in %r:\r\n"
+            "  os.remove(n)\r\n" % [self._fqn(f) for f in files]
+        )
+
+        return files
+
+    def __put_pipelined(self, data, dst):
+
+        file_size = len(data)
+
+        self._define_writer()
+        self.exec_raw_no_follow(
+            "f = _W('%s')\r\n"
+            "n = %d\r\n"
+            "w = 0\r\n"
+            "while w < n:\r\n"
+            "  d = ubinascii.unhexlify(sys.stdin.read(2 * min(n - w, %d)))\r\n"
+            "  f.write(d)\r\n"
+            "  w += len(d)\r\n"
+            "f.close()\r\n"
+            "print(w)\r\n"
+            "del f, n, w, d\r\n" % (self._fqn(dst), file_size, self.PIPE_BLOCK_SIZE)
+        )
+
+        self.progress.start(dst, file_size)
+
+        try:
+            pos = 0
+            while pos < file_size:
+                self.con.write(binascii.hexlify(data[pos:pos + self.PIPE_BLOCK_SIZE]))
+                pos += self.PIPE_BLOCK_SIZE
+                self.progress.update(min(pos, file_size))
+                # the receiver only talks before the end when it died
+                if self.con.inWaiting():
+                    break
+        finally:
+            self.progress.finish()
+
+        try:
+            ret, ret_err = self.follow(self.PIPE_TIMEOUT)
+        except PyboardError:
+            # data got lost on the way, stop the receiver waiting for it
+            self.con.write(b'\x03')
+            self.read_until(1, b'\x04>', timeout=1)
+            raise PyboardError("pipelined upload stalled, the link may lack flow control")
+
+        if ret_err:
+            # drop whatever is still queued in the input of the raw REPL
+            self.con.write(b'\x03')
+            raise PyboardError('exception', ret, ret_err)
+
+        if int(ret.strip()) != file_size:
+            raise PyboardError("pipelined upload wrote %s of %d bytes" % (ret.strip(), file_size))
+
+    def put_verified(self, src, dst=None, pipelined=False):
+        """
+        Upload a file and compare its checksum on the device with the local one.
 
-                self.rm(f)
+        :raises RemoteIOError:  if the digests differ
+        """
+
+        self.put(src, dst, pipelined)
+        self.__check([(src, src if dst is None else dst)])
 
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
-    def put(self, src, dst=None):
+    def put(self, src, dst=None, pipelined=False):
 
         f = open(src, "rb")
         data = f.read()
@@ -284,18 +663,12 @@ class MpFileExplorer(Pyboard):
 
         try:
 
-            self.exec_("f = open('%s', 'wb')" % self._fqn(dst))
-
-            file_size = len(data)
-            while True:
-                c = binascii.hexlify(data[:self.BIN_CHUNK_SIZE])
-                if not len(c):
-                    break
-
-                self.exec_("f.write(ubinascii.unhexlify('%s'))" % c.decode('utf-8'))
-                data = data[self.BIN_CHUNK_SIZE:]
+            if pipelined:
+                self.__put_pipelined(data, dst)
+                return
 
-                print("\ttransfer %d of %d" % (file_size - len(data), file_size))
+            self._open_writer(dst)
+            self._send_chunks(data, "f.write", name=dst)
             self.exec_("f.close()")
 
         except PyboardError as e:
@@ -306,204 +679,1414 @@ class MpFileExplorer(Pyboard):
             else:
                 raise e
 
-    def mput(self, src_dir, pat, verbose=False):
-
-        try:
-
-            find = re.compile(pat)
-            files = os.listdir(src_dir)
+    def batch(self, ops):
+        """
+        Run a sequence of "md", "rm" and "cd" operations within a single exec.
+        They are applied in order and a failing one does not stop the rest,
+        just like running them one by one. "cd" changes the directory the
+        following relative names refer to. Not retried, the operations are
+        not idempotent.
+
+        :param ops:         list of (operation, remote name) tuples
+        :return:            list of (absolute path, RemoteIOError or None), one per operation
+        """
 
-            for f in files:
-                if posixpath.isfile(f) and find.match(f):
-                    if verbose:
-                        print(" * put %s" % f)
+        ret = self.exec_(
+            "def _n(c, t):\r\n"
+            "  r = []\r\n"
+            "  for x in (t if t.startswith('/') else c + '/' + t).split('/'):\r\n"
+            "    if x == '..':\r\n"
+            "      if r:\r\n"
+            "        r.pop()\r\n"
+            "    elif x and x != '.':\r\n"
+            "      r.append(x)\r\n"
+            "  return '/' + '/'.join(r)\r\n"
+            "c = '%s'\r\n"
+            "for o, t in %r:\r\n"
+            "  p = _n(c, t)\r\n"
+            "  try:\r\n"
+            "    if o == 'md':\r\n"
+            "      os.mkdir(p)\r\n"
+            "    elif o == 'rm':\r\n"
+            "      try:\r\n"
+            "        os.remove(p)\r\n"
+            "      except OSError:\r\n"
+            "        os.rmdir(p)\r\n"
+            "    elif os.stat(p)[0] & 0x4000:\r\n"
+            "      c = p\r\n"
+            "    else:\r\n"
+            "      raise OSError(20)\r\n"
+            "    print(0, p)\r\n"
+            "  except OSError as e:\r\n"
+            "    print(e.args[0], p)\r\n"
+            "print(c)\r\n"
+            "del _n, c\r\n" % (self.dir, list(ops))
+        )
+
+        lines = ret.decode("utf-8").splitlines()
+        results = []
+
+        for (op, target), line in zip(ops, lines):
+
+            err, path = line.split(" ", 1)
+            err = int(err)
+
+            if not err:
+                results.append((path, None))
+            elif op == "md" and err == 17:
+                results.append((path, RemoteIOError("File or directory exists: %s" % target)))
+            elif op == "md":
+                results.append((path, RemoteIOError("Invalid directory name: %s" % target)))
+            elif op == "rm" and err in (1, 13, 39):
+                results.append((path, RemoteIOError("Directory not empty: %s" % target)))
+            elif op == "rm":
+                results.append((path, RemoteIOError("No such file or directory: %s" % target)))
+            else:
+                results.append((path, RemoteIOError("No such directory: %s" % target)))
 
-                    self.put(posixpath.join(src_dir, f), f)
+        self.dir = lines[-1].strip()
 
-        except sre_constants.error as e:
-            raise RemoteIOError("Error in regular expression: %s" % e)
+        return results
 
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
-    def get(self, src, dst=None):
+    def mds(self, targets):
+        """
+        Create several remote directories within a single exec. Directories
+        which already exist are silently skipped, parents must come before
+        their children.
 
-        if src not in self.ls():
-            raise RemoteIOError("No such file or directory: '%s'" % self._fqn(src))
+        :param targets:     list of directory names (relative or absolute)
+        """
 
-        if dst is None:
-            dst = src
+        dirs = [self._fqn(t) for t in targets]
 
-        f = open(dst, "wb")
+        if not len(dirs):
+            return
 
         try:
 
-            self.exec_("f = open('%s', 'rb')" % self._fqn(src))
-            ret = self.exec_(
-                "while True:\r\n"
-                "  c = ubinascii.hexlify(f.read(%s))\r\n"
-                "  if not len(c):\r\n"
-                "    break\r\n"
-                "  sys.stdout.write(c)\r\n" % self.BIN_CHUNK_SIZE
+            self.exec_(
+                "for d in %r:\r\n"
+                "  try:\r\n"
+                "    os.mkdir(d)\r\n"
+                "  except OSError as e:\r\n"
+                "    if e.args[0] != 17:\r\n"
+                "      raise\r\n" % dirs
             )
 
         except PyboardError as e:
             if _was_file_not_existing(e):
-                raise RemoteIOError("Failed to read file: %s" % src)
+                raise RemoteIOError("Invalid directory name in: %s" % ", ".join(targets))
             else:
                 raise e
 
-        f.write(binascii.unhexlify(ret))
-        f.close()
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def walk(self, target=None):
+        """
+        Walk the remote tree below target within a single exec.
 
-    def mget(self, dst_dir, pat, verbose=False):
+        :param target:      remote directory, defaults to the current one
+        :return:            list of (path, type, size) tuples with absolute paths,
+                            every directory is listed before its content
+        """
+
+        top = self.dir if target is None else self._fqn(target)
 
         try:
 
-            files = self.ls(add_dirs=False)
-            find = re.compile(pat)
+            ret = self.exec_(
+                "def _walk(p):\r\n"
+                "  for n in os.listdir(p):\r\n"
+                "    q = p.rstrip('/') + '/' + n\r\n"
+                "    s = os.stat(q)\r\n"
+                "    if s[0] & 0x4000:\r\n"
+                "      print('D 0 ' + q)\r\n"
+                "      _walk(q)\r\n"
+                "    else:\r\n"
+                "      print('F %%d %%s' %% (s[6], q))\r\n"
+                "_walk('%s')\r\n"
+                "del _walk\r\n" % top
+            )
 
-            for f in files:
-                if find.match(f):
-                    if verbose:
-                        print(" * get %s" % f)
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("No such directory: %s" % top)
+            else:
+                raise e
 
-                    self.get(f, dst=posixpath.join(dst_dir, f))
+        entries = []
 
-        except sre_constants.error as e:
-            raise RemoteIOError("Error in regular expression: %s" % e)
+        for line in ret.decode("utf-8").splitlines():
+            if len(line):
+                kind, size, path = line.split(" ", 2)
+                entries.append((path, kind, int(size)))
+
+        return entries
 
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
-    def gets(self, src):
+    def put_bundle(self, files, verbose=False):
+        """
+        Upload many files as one archive stream. Each file is packed as a
+        "<size> <remote path>\\n" header followed by its content, and a small
+        extractor on the device writes the files while the stream arrives.
+        This saves the open/close round trips of every single file.
+
+        :param files:       list of (local path, remote path) tuples
+        """
+
+        data = b""
+
+        for src, dst in files:
+
+            f = open(src, "rb")
+            content = f.read()
+            f.close()
+
+            if verbose:
+                print(" * bundle %s (%d bytes)" % (dst, len(content)))
+
+            data += ("%d %s\n" % (len(content), self._fqn(dst))).encode("utf-8") + content
 
         try:
 
-            self.exec_("f = open('%s', 'rb')" % self._fqn(src))
-            ret = self.exec_(
-                "while True:\r\n"
-                "  c = ubinascii.hexlify(f.read(%s))\r\n"
-                "  if not len(c):\r\n"
-                "    break\r\n"
-                "  sys.stdout.write(c)\r\n" % self.BIN_CHUNK_SIZE
+            self._define_writer()
+            self.exec_(
+                "class _X:\r\n"
+                "  def __init__(s):\r\n"
+                "    s.f = None\r\n"
+                "    s.n = 0\r\n"
+                "    s.h = b''\r\n"
+                "  def feed(s, d):\r\n"
+                "    while len(d):\r\n"
+                "      if s.f is None:\r\n"
+                "        s.h += d\r\n"
+                "        i = s.h.find(b'\\n')\r\n"
+                "        if i < 0:\r\n"
+                "          return\r\n"
+                "        n, p = s.h[:i].decode().split(' ', 1)\r\n"
+                "        d = s.h[i + 1:]\r\n"
+                "        s.h = b''\r\n"
+                "        s.n = int(n)\r\n"
+                "        s.f = _W(p)\r\n"
+                "      w = d[:s.n]\r\n"
+                "      s.f.write(w)\r\n"
+                "      s.n -= len(w)\r\n"
+                "      d = d[len(w):]\r\n"
+                "      if not s.n:\r\n"
+                "        s.f.close()\r\n"
+                "        s.f = None\r\n"
+                "_x = _X()\r\n"
             )
 
+            self._send_chunks(data, "_x.feed", name="bundle of %d files" % len(files))
+            self.exec_("del _x, _X")
+
         except PyboardError as e:
             if _was_file_not_existing(e):
-                raise RemoteIOError("Failed to read file: %s" % src)
+                raise RemoteIOError("Failed to create file in bundle")
+            elif "EACCES" in str(e):
+                raise RemoteIOError("Existing directory in bundle")
             else:
                 raise e
 
-        try:
+    def _parents(self, targets, base):
+        """
+        :param targets:     remote file names
+        :param base:        remote directory the parents must be in
+        :return:            all parent directories of targets within base (including it),
+                            parents first, suitable for mds
+        """
 
-            return binascii.unhexlify(ret).decode("utf-8")
+        base = self._fqn(base).rstrip("/")
+        dirs = set()
 
-        except UnicodeDecodeError:
+        for target in targets:
+            parent = posixpath.dirname(self._fqn(target))
+            while parent != "/" and (parent == base or parent.startswith(base + "/")):
+                dirs.add(parent)
+                parent = posixpath.dirname(parent)
 
-            s = ret.decode("utf-8")
-            fs = "\nBinary file:\n\n"
+        return sorted(dirs, key=lambda d: d.count("/"))
 
-            while len(s):
-                fs += s[:64] + "\n"
-                s = s[64:]
+    def put_files(self, files, verbose=False, dst_root=None):
+        """
+        Upload a set of files, creating missing parent directories below
+        the destination root in one exec. Several files are sent as one
+        bundle.
 
-            return fs
+        :param files:       list of (local path, remote path) tuples
+        :param dst_root:    remote directory the uploads go to, defaults to the current one
+        """
+
+        self.preflight([(os.path.getsize(src), dst) for src, dst in files])
+        self.mds(self._parents([dst for _, dst in files], self.dir if dst_root is None else dst_root))
+
+        if len(files) > 1:
+            self.put_bundle(files, verbose)
+        else:
+            for src, dst in files:
+                if verbose:
+                    print(" * put %s" % dst)
+                self.put(src, dst)
 
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
-    def puts(self, dst, lines):
+    def checksums(self, targets, cached=True):
+        """
+        Calculate the SHA256 of several remote files within a single exec.
+        The files are hashed on the device in small blocks, each digest is
+        read as soon as it is ready, so large files do not run into a timeout.
+
+        :param targets:     list of remote file names
+        :param cached:      allow digests remembered from earlier calls (caching explorer)
+        :return:            dict of absolute remote path to hex digest,
+                            files which do not exist are left out
+        """
 
-        try:
+        paths = [self._fqn(t) for t in targets]
+
+        if not len(paths):
+            return {}
+
+        lines = self._stream_lines(
+            "import uhashlib\r\n"
+            "def _h(p):\r\n"
+            "  h = uhashlib.sha256()\r\n"
+            "  b = bytearray(512)\r\n"
+            "  m = memoryview(b)\r\n"
+            "  with open(p, 'rb') as f:\r\n"
+            "    while True:\r\n"
+            "      n = f.readinto(b)\r\n"
+            "      if not n:\r\n"
+            "        break\r\n"
+            "      h.update(m[:n])\r\n"
+            "  return ubinascii.hexlify(h.digest()).decode()\r\n"
+            "for p in %r:\r\n"
+            "  try:\r\n"
+            "    print(_h(p), p)\r\n"
+            "  except OSError:\r\n"
+            "    pass\r\n"
+            "del _h\r\n" % paths
+        )
+
+        digests = {}
+
+        for line in lines:
+            digest, path = line.split(" ", 1)
+            digests[path] = digest
+
+        return digests
+
+    def _stream_lines(self, command, callback=None):
+        """
+        Run a command and hand every line of its output to callback as soon
+        as it arrives, instead of waiting for the command to finish.
 
-            data = lines.encode("utf-8")
+        :param command:     device code printing one result per line
+        :param callback:    called with each line (str)
+        :return:            list of all lines
+        """
 
-            self.exec_("f = open('%s', 'wb')" % self._fqn(dst))
-            
-            while True:
-                c = binascii.hexlify(data[:self.BIN_CHUNK_SIZE])
-                if not len(c):
-                    break
+        pending = [b""]
 
-                self.exec_("f.write(ubinascii.unhexlify('%s'))" % c.decode('utf-8'))
-                data = data[self.BIN_CHUNK_SIZE:]
+        def consumer(data):
+            pending[0] += data
+            while b"\n" in pending[0]:
+                line, pending[0] = pending[0].split(b"\n", 1)
+                if callback is not None:
+                    callback(line.rstrip(b"\r").decode("utf-8", "replace"))
 
-            self.exec_("f.close()")
+        self.exec_raw_no_follow(command)
+        ret, ret_err = self.follow(None, consumer)
+
+        if ret_err:
+            raise PyboardError('exception', ret, ret_err)
+
+        return [l for l in ret.decode("utf-8", "replace").replace("\r", "").split("\n") if len(l)]
+
+    def find(self, pattern, target=None, callback=None):
+        """
+        Search the remote tree for names matching a shell pattern ("*" and
+        "?"). The walk runs on the device within a single exec.
+
+        :param pattern:     pattern matched against file and directory names
+        :param target:      remote directory to search, defaults to the current one
+        :param callback:    called with every match as soon as it is found
+        :return:            list of matching absolute paths
+        """
+
+        top = self.dir if target is None else self._fqn(target)
+
+        try:
+
+            return self._stream_lines(
+                "def _m(p, s):\r\n"
+                "  if not p:\r\n"
+                "    return not s\r\n"
+                "  if p[0] == '*':\r\n"
+                "    return _m(p[1:], s) or (len(s) > 0 and _m(p, s[1:]))\r\n"
+                "  return len(s) > 0 and p[0] in ('?', s[0]) and _m(p[1:], s[1:])\r\n"
+                "def _f(d, p):\r\n"
+                "  for n in os.listdir(d):\r\n"
+                "    q = d.rstrip('/') + '/' + n\r\n"
+                "    if _m(p, n):\r\n"
+                "      print(q)\r\n"
+                "    if os.stat(q)[0] & 0x4000:\r\n"
+                "      _f(q, p)\r\n"
+                "try:\r\n"
+                "  _f(%r, %r)\r\n"
+                "finally:\r\n"
+                "  del _m, _f\r\n" % (top, pattern), callback
+            )
 
         except PyboardError as e:
             if _was_file_not_existing(e):
-                raise RemoteIOError("Failed to create file: %s" % dst)
-            elif "EACCES" in str(e):
-                raise RemoteIOError("Existing directory: %s" % dst)
+                raise RemoteIOError("No such directory: %s" % top)
             else:
                 raise e
 
-    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
-    def cd(self, target):
+    def grep(self, regex, target, callback=None):
+        """
+        Search remote files for lines matching a regular expression (as far
+        as the device "re" module supports it). Directories are searched
+        recursively, files which can not be decoded are skipped. Everything
+        runs on the device within a single exec.
+
+        :param regex:       regular expression
+        :param target:      remote file or directory
+        :param callback:    called with every match ("path:line:text") as soon as it is found
+        :return:            list of matches
+        """
 
-        if target.startswith("/"):
-            tmp_dir = target
-        elif target == "..":
-            tmp_dir, _ = posixpath.split(self.dir)
-        else:
-            tmp_dir = self._fqn(target)
+        top = self._fqn(target)
 
-        # see if the new dir exists
         try:
 
-            self.eval("os.listdir('%s')" % tmp_dir)
-            self.dir = tmp_dir
+            return self._stream_lines(
+                "try:\r\n"
+                "  import re\r\n"
+                "except ImportError:\r\n"
+                "  import ure as re\r\n"
+                "def _g(p, r):\r\n"
+                "  if os.stat(p)[0] & 0x4000:\r\n"
+                "    for n in os.listdir(p):\r\n"
+                "      _g(p.rstrip('/') + '/' + n, r)\r\n"
+                "    return\r\n"
+                "  try:\r\n"
+                "    with open(p) as f:\r\n"
+                "      i = 0\r\n"
+                "      for l in f:\r\n"
+                "        i += 1\r\n"
+                "        if r.search(l):\r\n"
+                "          print('%%s:%%d:%%s' %% (p, i, l.rstrip('\\r\\n')))\r\n"
+                "  except UnicodeError:\r\n"
+                "    pass\r\n"
+                "try:\r\n"
+                "  _g(%r, re.compile(%r))\r\n"
+                "finally:\r\n"
+                "  del _g\r\n" % (top, regex), callback
+            )
 
         except PyboardError as e:
             if _was_file_not_existing(e):
-                raise RemoteIOError("No such directory: %s" % target)
+                raise RemoteIOError("No such file or directory: %s" % top)
+            elif "Error in regex" in str(e):
+                raise RemoteIOError("Invalid regular expression: %s" % regex)
             else:
                 raise e
 
-    def pwd(self):
-        return self.dir
-
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
-    def md(self, target):
-
-        try:
+    def df(self, target=None):
+        """
+        :param target:      remote path selecting the file system, defaults to the current directory
+        :return:            (block size, total bytes, free bytes), all zero if the
+                            file system does not report its size
+        """
 
-            self.eval("os.mkdir('%s')" % self._fqn(target))
+        path = self.dir if target is None else self._fqn(target)
 
+        try:
+            st = ast.literal_eval(self.eval("os.statvfs('%s')" % path).decode("utf-8"))
         except PyboardError as e:
             if _was_file_not_existing(e):
-                raise RemoteIOError("Invalid directory name: %s" % target)
-            elif "EEXIST" in str(e):
-                raise RemoteIOError("File or directory exists: %s" % target)
+                raise RemoteIOError("No such file or directory: %s" % path)
             else:
                 raise e
 
-    def mpy_cross(self, src, dst=None):
+        # f_frsize is 0 on some ports, f_bsize is the unit then
+        bsize = st[1] or st[0]
 
-        if dst is None:
-            return_code = subprocess.call("mpy-cross %s" % (src), shell=True)
-        else:
-            return_code = subprocess.call("mpy-cross -o %s %s" % (src, dst), shell=True)
+        return bsize, st[2] * bsize, st[4] * bsize
 
-        if return_code != 0:
-            raise IOError("Filed to compile: %s" % src)
+    def du(self, target=None):
+        """
+        Sum up the size of a remote file or tree, the tree is walked on the
+        device within a single exec.
+
+        :param target:      remote file or directory, defaults to the current directory
+        :return:            (number of bytes, number of files, number of directories)
+        """
+
+        try:
+            entries = self.walk(target)
+        except RemoteIOError:
+            # maybe a plain file
+            return self.size(target), 1, 0
+
+        files = [e for e in entries if e[1] == 'F']
+
+        return sum(e[2] for e in files), len(files), len(entries) - len(files)
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def preflight(self, files):
+        """
+        Make sure a set of files fits on the remote file system before any of
+        them is sent. Files being overwritten are accounted for, sizes are
+        rounded up to whole blocks. Everything is checked within a single exec.
+
+        :param files:       list of (number of bytes, remote file) tuples
+        :raises RemoteIOError:  if the space is short, with the missing number of bytes
+        """
+
+        if not len(files):
+            return
+
+        paths = [self._fqn(dst) for _, dst in files]
+
+        ret = self.exec_(
+            "d = '%s'\r\n"
+            "while True:\r\n"
+            "  try:\r\n"
+            "    s = os.statvfs(d)\r\n"
+            "    break\r\n"
+            "  except OSError:\r\n"
+            "    if d == '/':\r\n"
+            "      raise\r\n"
+            "    d = d[:d.rfind('/')] or '/'\r\n"
+            "print(s[1] or s[0], s[2], s[4])\r\n"
+            "for p in %r:\r\n"
+            "  try:\r\n"
+            "    print(os.stat(p)[6])\r\n"
+            "  except OSError:\r\n"
+            "    print(0)\r\n"
+            "del d, s\r\n" % (paths[0], paths)
+        )
+
+        lines = ret.decode("utf-8").split()
+        bsize, blocks, free = [int(v) for v in lines[:3]]
+
+        if not blocks:
+            # size unknown (e.g. the host mount)
+            return
+
+        def used(n):
+            return (n + bsize - 1) // bsize * bsize
+
+        needed = sum(used(size) for size, _ in files) - sum(used(int(v)) for v in lines[3:])
+        free *= bsize
+
+        if needed > free:
+            raise RemoteIOError("Not enough space on device: %d bytes needed, %d bytes free (%d bytes short)"
+                                % (needed, free, needed - free))
+
+    def sha256(self, target):
+        """
+        :param target:      remote file
+        :return:            hex SHA256 of the file, calculated on the device
+        """
+
+        digest = self.checksums([target], cached=False).get(self._fqn(target))
+
+        if digest is None:
+            raise RemoteIOError("No such file: %s" % target)
+
+        return digest
+
+    def verify_files(self, files):
+        """
+        Compare local files with their remote copies by hashing both sides.
+        All remote files are hashed within a single exec, nothing is read back.
+
+        :param files:       list of (local file, remote file) tuples
+        :return:            list of remote files which differ or are missing
+        """
+
+        remote = self.checksums([dst for _, dst in files], cached=False)
+
+        return [dst for src, dst in files if remote.get(self._fqn(dst)) != _sha256(src)]
+
+    def deploy(self, src_dir, dst_dir=None, compile=True, args=(), verbose=False, entry=None):
+        """
+        Compile, compare and upload a local tree in overlapping stages.
+        Python files are compiled with mpy-cross and all files are hashed on
+        worker threads, while the link fetches the remote hashes and uploads
+        every file as soon as it is ready and differs from the device.
+        boot.py and main.py stay source files.
+
+        :param src_dir:     local directory
+        :param dst_dir:     remote directory, defaults to the current one
+        :param compile:     compile python files to .mpy
+        :param args:        extra mpy-cross arguments
+        :param entry:       entry script (relative to src_dir), if given only the
+                            modules it imports (directly or not) are deployed
+        :return:            (files uploaded, files unchanged, bytes uploaded, seconds)
+        """
+
+        if not os.path.isdir(src_dir):
+            raise IOError("No such local directory: %s" % src_dir)
+
+        import multiprocessing
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        from mp import mpycross
+        from mp import depends
+
+        dst_root = self.dir if dst_dir is None else self._fqn(dst_dir)
+        sources = mpycross.find_sources(src_dir) if compile else []
+        needed = None if entry is None else depends.reachable(src_dir, entry)
+        jobs = []
+
+        for root, dirs, names in os.walk(src_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".") and d != "__pycache__"]
+            for n in names:
+                src = os.path.join(root, n)
+                if needed is not None and os.path.abspath(src) not in needed:
+                    continue
+                if n.endswith(".mpy") and src[:-4] + ".py" in sources:
+                    continue
+                rel = os.path.relpath(src, src_dir).replace(os.sep, "/")
+                if src in sources:
+                    rel = rel[:-3] + ".mpy"
+                jobs.append((src, posixpath.join(dst_root, rel)))
+
+        def prepare(job):
+            src, dst = job
+            if src in sources:
+                mpycross.compile_file(src, args=args)
+                src = mpycross.mpy_name(src)
+            return src, dst, _sha256(src)
+
+        start = time.time()
+        uploaded = unchanged = size = 0
+
+        with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as pool:
+
+            futures = [pool.submit(prepare, job) for job in jobs]
+
+            # the link works on the device state while the host compiles
+            stale = [dst[:-4] + ".py" for _, dst in jobs if dst.endswith(".mpy")]
+            remote = self.checksums([dst for _, dst in jobs] + stale)
+            self.mds(self._parents([dst for _, dst in jobs], dst_root))
+
+            for path in stale:
+                if path in remote:
+                    if verbose:
+                        print(" * rm %s (replaced by .mpy)" % path)
+                    self.rm(path)
+
+            for future in as_completed(futures):
+
+                src, dst, digest = future.result()
+
+                if remote.get(dst) == digest:
+                    unchanged += 1
+                    continue
+
+                if verbose:
+                    print(" * put %s" % dst)
+
+                self.put(src, dst)
+                uploaded += 1
+                size += os.path.getsize(src)
+
+        return uploaded, unchanged, size, time.time() - start
+
+    def put_tree(self, src_dir, dst_dir=None, verbose=False, bundle=False, pipelined=False, minify=False,
+                 verify=False):
+        """
+        Recursively upload a local directory. The whole transfer is planned
+        up front: all remote directories are created in one exec, then the
+        files are sent smallest first. Hidden files and directories (e.g.
+        .git), __pycache__ and editor backups are left out.
+
+        :param src_dir:     local directory to upload
+        :param dst_dir:     remote directory, defaults to the name of src_dir
+        :param bundle:      send all files as one archive stream (see put_bundle)
+        :param pipelined:   use pipelined chunk submission for every file
+        :param minify:      strip comments, docstrings and indentation from python files
+        :param verify:      compare checksums of all files after the upload
+        :return:            (number of files, number of bytes, seconds)
+        """
+
+        if not os.path.isdir(src_dir):
+            raise IOError("No such local directory: %s" % src_dir)
+
+        if dst_dir is None:
+            dst_dir = os.path.basename(os.path.abspath(src_dir))
+
+        dst_root = self._fqn(dst_dir)
+        dirs = [dst_root]
+        files = []
+
+        for root, subdirs, names in os.walk(src_dir):
+
+            subdirs[:] = [d for d in subdirs if not d.startswith(".") and d != "__pycache__"]
+            names = [n for n in names if not n.startswith(".") and not n.endswith("~") and not n.endswith(".swp")]
+
+            rel = os.path.relpath(root, src_dir)
+
+            if rel == ".":
+                rdir = dst_root
+            else:
+                rdir = posixpath.join(dst_root, rel.replace(os.sep, "/"))
+                dirs.append(rdir)
+
+            for n in names:
+                lpath = os.path.join(root, n)
+                if minify and n.endswith(".py"):
+                    from mp.minify import minify_file
+                    lpath = minify_file(lpath)
+                files.append((os.path.getsize(lpath), lpath, posixpath.join(rdir, n)))
+
+        files.sort()
+
+        self.preflight([(size, rpath) for size, _, rpath in files])
+
+        start = time.time()
+        self.mds(dirs)
+
+        if bundle:
+            self.put_bundle([(lpath, rpath) for _, lpath, rpath in files], verbose)
+        else:
+            for size, lpath, rpath in files:
+                if verbose:
+                    print(" * put %s (%d bytes)" % (rpath, size))
+
+                self.put(lpath, rpath, pipelined)
+
+        secs = time.time() - start
+
+        if verify:
+            self.__check([(lpath, rpath) for _, lpath, rpath in files])
+
+        return len(files), sum(f[0] for f in files), secs
+
+    def __check(self, files):
+
+        failed = self.verify_files(files)
+
+        if len(failed):
+            raise RemoteIOError("Verification failed for: %s" % ", ".join(failed))
+
+    def get_tree(self, src_dir, dst_dir=None, verbose=False):
+        """
+        Recursively download a remote directory. The remote tree is walked
+        in one exec, local directories are created before any download starts,
+        then the files are fetched smallest first.
+
+        :param src_dir:     remote directory to download
+        :param dst_dir:     local directory, defaults to the name of src_dir
+        :return:            (number of files, number of bytes, seconds)
+        """
+
+        src_root = self._fqn(src_dir)
+
+        if dst_dir is None:
+            dst_dir = posixpath.basename(src_root.rstrip("/")) or "."
+
+        start = time.time()
+        entries = self.walk(src_root)
+        files = []
+
+        if not os.path.isdir(dst_dir):
+            os.makedirs(dst_dir)
+
+        for path, kind, size in entries:
+
+            lpath = os.path.join(dst_dir, *posixpath.relpath(path, src_root).split("/"))
+
+            if kind == 'D':
+                if not os.path.isdir(lpath):
+                    os.makedirs(lpath)
+            else:
+                files.append((size, path, lpath))
+
+        files.sort()
+
+        for size, rpath, lpath in files:
+            if verbose:
+                print(" * get %s (%d bytes)" % (rpath, size))
+
+            self._get_file(rpath, lpath)
+
+        return len(files), sum(f[0] for f in files), time.time() - start
+
+    def mput(self, src_dir, pat, verbose=False, bundle=False):
+
+        try:
+
+            find = re.compile(pat)
+            files = os.listdir(src_dir)
+
+            self.preflight([(os.path.getsize(posixpath.join(src_dir, f)), f) for f in files
+                            if posixpath.isfile(posixpath.join(src_dir, f)) and find.match(f)])
+
+            if bundle:
+                self.put_bundle([(posixpath.join(src_dir, f), f) for f in files
+                                 if posixpath.isfile(posixpath.join(src_dir, f)) and find.match(f)], verbose)
+                return
+
+            for f in files:
+                if posixpath.isfile(f) and find.match(f):
+                    if verbose:
+                        print(" * put %s" % f)
+
+                    self.put(posixpath.join(src_dir, f), f)
+
+        except sre_constants.error as e:
+            raise RemoteIOError("Error in regular expression: %s" % e)
+
+    def get(self, src, dst=None):
+
+        if self.kind(src) != 'F':
+            raise RemoteIOError("Not a file: '%s'" % self._fqn(src))
+
+        if dst is None:
+            dst = src
+
+        self._get_file(src, dst)
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def _get_file(self, src, dst):
+
+        f = open(dst, "wb")
+
+        try:
+
+            self.exec_("f = open('%s', 'rb')" % self._fqn(src))
+            ret = self.exec_(
+                "while True:\r\n"
+                "  c = ubinascii.hexlify(f.read(%s))\r\n"
+                "  if not len(c):\r\n"
+                "    break\r\n"
+                "  sys.stdout.write(c)\r\n" % self.chunk_size
+            )
+
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("Failed to read file: %s" % src)
+            else:
+                raise e
+
+        f.write(binascii.unhexlify(ret))
+        f.close()
+
+    def mget(self, dst_dir, pat, verbose=False):
+
+        try:
+
+            files = self.ls(add_dirs=False)
+            find = re.compile(pat)
+
+            for f in files:
+                if find.match(f):
+                    if verbose:
+                        print(" * get %s" % f)
+
+                    self.get(f, dst=posixpath.join(dst_dir, f))
+
+        except sre_constants.error as e:
+            raise RemoteIOError("Error in regular expression: %s" % e)
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def gets(self, src):
+
+        try:
+
+            self.exec_("f = open('%s', 'rb')" % self._fqn(src))
+            ret = self.exec_(
+                "while True:\r\n"
+                "  c = ubinascii.hexlify(f.read(%s))\r\n"
+                "  if not len(c):\r\n"
+                "    break\r\n"
+                "  sys.stdout.write(c)\r\n" % self.chunk_size
+            )
+
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("Failed to read file: %s" % src)
+            else:
+                raise e
+
+        try:
+
+            return binascii.unhexlify(ret).decode("utf-8")
+
+        except UnicodeDecodeError:
+
+            s = ret.decode("utf-8")
+            fs = "\nBinary file:\n\n"
+
+            while len(s):
+                fs += s[:64] + "\n"
+                s = s[64:]
+
+            return fs
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def size(self, target):
+        """
+        :param target:      remote file
+        :return:            size of the file in bytes
+        """
+
+        try:
+            return int(self.eval("os.stat('%s')[6]" % self._fqn(target)))
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("No such file: %s" % target)
+            else:
+                raise e
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def read_range(self, target, offset=0, length=None):
+        """
+        Read part of a remote file. The device seeks to the offset and only
+        the requested bytes cross the link.
+
+        :param target:      remote file
+        :param offset:      start position, negative values count from the end
+        :param length:      number of bytes to read, None for everything up to the end
+        :return:            (data, current size of the file)
+        """
+
+        try:
+
+            ret = self.exec_(
+                "z = os.stat('%s')[6]\r\n"
+                "o = %d\r\n"
+                "o = o if o >= 0 else max(0, z + o)\r\n"
+                "n = %d\r\n"
+                "n = max(0, z - o if n < 0 else min(n, z - o))\r\n"
+                "print(z)\r\n"
+                "with open('%s', 'rb') as f:\r\n"
+                "  f.seek(o)\r\n"
+                "  while n:\r\n"
+                "    c = f.read(min(n, %d))\r\n"
+                "    if not c:\r\n"
+                "      break\r\n"
+                "    sys.stdout.write(ubinascii.hexlify(c))\r\n"
+                "    n -= len(c)\r\n"
+                "del z, o, n\r\n" % (self._fqn(target), offset, -1 if length is None else length,
+                                     self._fqn(target), self.chunk_size)
+            )
+
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("Failed to read file: %s" % target)
+            else:
+                raise e
+
+        size, data = ret.split(b"\n", 1)
+
+        return binascii.unhexlify(data.strip()), int(size)
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def puts(self, dst, lines):
+
+        try:
+
+            data = lines.encode("utf-8")
+
+            self._open_writer(dst)
+            self._send_chunks(data, "f.write", False)
+            self.exec_("f.close()")
+
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("Failed to create file: %s" % dst)
+            elif "EACCES" in str(e):
+                raise RemoteIOError("Existing directory: %s" % dst)
+            else:
+                raise e
+
+    def _cd_target(self, target):
+
+        if target.startswith("/"):
+            return posixpath.normpath(target)
+        elif target == "..":
+            return posixpath.split(self.dir)[0]
+        else:
+            return posixpath.normpath(self._fqn(target))
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def stat(self, target):
+        """
+        :param target:      remote file or directory
+        :return:            (type, size) with type 'D' for directories and 'F' for files
+        """
+
+        try:
+            st = ast.literal_eval(self.eval("os.stat('%s')" % self._fqn(target)).decode("utf-8"))
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("No such file or directory: %s" % self._fqn(target))
+            else:
+                raise e
+
+        return 'D' if st[0] & 0x4000 else 'F', st[6]
+
+    def kind(self, target):
+        """
+        :param target:      remote file or directory
+        :return:            'D' for directories, 'F' for files
+        """
+
+        return self.stat(target)[0]
+
+    def run(self, command, data_consumer=None):
+        """
+        Run arbitrary user code and wait for it to finish.
+
+        :param command:         python code
+        :param data_consumer:   called with the output while the code runs
+        :return:                (output, error output)
+        """
+
+        self.exec_raw_no_follow(command)
+        return self.follow(None, data_consumer)
+
+    def invalidate(self):
+        """
+        Forget everything known about the remote files (nothing is cached here).
+        """
+
+        pass
+
+    def cached_listing(self, target):
+        """
+        :param target:      remote directory
+        :return:            list of (name, type) tuples known without asking the
+                            device, None if unknown (this explorer caches nothing)
+        """
+
+        return None
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def cd(self, target):
+
+        tmp_dir = self._cd_target(target)
+
+        # see if the new dir exists
+        try:
+
+            self.eval("os.listdir('%s')" % tmp_dir)
+            self.dir = tmp_dir
+
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("No such directory: %s" % target)
+            else:
+                raise e
+
+    def pwd(self):
+        return self.dir
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def md(self, target):
+
+        try:
+
+            self.eval("os.mkdir('%s')" % self._fqn(target))
+
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("Invalid directory name: %s" % target)
+            elif "EEXIST" in str(e):
+                raise RemoteIOError("File or directory exists: %s" % target)
+            else:
+                raise e
+
+    def __target(self, src, dst):
+        """
+        :return:            device code setting "s" and "d" to the absolute source and
+                            target, a directory as target receives the source by its name
+        """
+
+        return (
+            "s = '%s'\r\n"
+            "d = '%s'\r\n"
+            "try:\r\n"
+            "  if os.stat(d)[0] & 0x4000:\r\n"
+            "    d = d.rstrip('/') + '/' + s[s.rfind('/') + 1:]\r\n"
+            "except OSError:\r\n"
+            "  pass\r\n" % (self._fqn(src), self._fqn(dst))
+        )
+
+    def cp(self, src, dst):
+        """
+        Copy a remote file on the device, the data never crosses the link.
+        Large files take a while, so the copy is neither timed out nor retried.
+
+        :param src:         remote file
+        :param dst:         remote file or directory
+        :return:            absolute name of the copy
+        """
+
+        try:
+
+            lines = self._stream_lines(
+                self.__target(src, dst) +
+                "if s == d:\r\n"
+                "  raise ValueError('same file')\r\n"
+                "try:\r\n"
+                "  n = os.statvfs(d[:d.rfind('/')] or '/')[0]\r\n"
+                "except Exception:\r\n"
+                "  n = 512\r\n"
+                "b = bytearray(n if n > 0 else 512)\r\n"
+                "m = memoryview(b)\r\n"
+                "with open(s, 'rb') as r:\r\n"
+                "  with open(d, 'wb') as w:\r\n"
+                "    while True:\r\n"
+                "      n = r.readinto(b)\r\n"
+                "      if not n:\r\n"
+                "        break\r\n"
+                "      w.write(m[:n])\r\n"
+                "print(d)\r\n"
+                "del s, d, n, b, m\r\n"
+            )
+
+        except PyboardError as e:
+            if "same file" in str(e):
+                raise RemoteIOError("'%s' and '%s' are the same file" % (src, dst))
+            elif _was_file_not_existing(e):
+                raise RemoteIOError("No such file or directory: %s" % src)
+            elif "EISDIR" in str(e):
+                raise RemoteIOError("Not a file: %s" % src)
+            else:
+                raise e
+
+        return lines[-1].strip()
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def mv(self, src, dst):
+        """
+        Move or rename a remote file or directory with os.rename.
+
+        :param src:         remote file or directory
+        :param dst:         new name or an existing remote directory
+        :return:            absolute new name
+        """
+
+        try:
+
+            ret = self.exec_(
+                self.__target(src, dst) +
+                "os.rename(s, d)\r\n"
+                "print(d)\r\n"
+                "del s, d\r\n"
+            )
+
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("No such file or directory: %s" % src)
+            elif "EEXIST" in str(e) or "EACCES" in str(e):
+                raise RemoteIOError("Target exists: %s" % dst)
+            else:
+                raise e
+
+        return ret.decode("utf-8").strip()
+
+    def exec_local(self, src, data_consumer=None):
+        """
+        Run a local script on the device without storing it on the file
+        system. Small scripts are sent as a single raw REPL command, larger
+        ones are collected in RAM in chunks first and then executed.
+
+        :param src:             local python file
+        :param data_consumer:   called with the output while the script runs
+        :return:                (output, error output)
+        """
+
+        with open(src, "rb") as f:
+            data = f.read()
+
+        if len(data) > self.chunk_size:
+            self.exec_("_s = bytearray()")
+            self._send_chunks(data, "_s.extend", False)
+            data = "_s = str(_s, 'utf-8')\r\nexec(_s)\r\n"
+
+        ret = self.run(data, data_consumer)
+
+        try:
+            self.exec_("try:\r\n  del _s\r\nexcept NameError:\r\n  pass\r\n")
+        except PyboardError:
+            pass
+
+        return ret
+
+    def __drop_mount(self):
+
+        if self.mount_server is not None:
+            self.mount_server.close()
+            self.mount_server = None
+            self.intercept = None
+
+    def mount(self, local_dir):
+        """
+        Mount a local directory on the device at MOUNT_POINT. File access on
+        the device is forwarded to the host while a command runs, so imports
+        and reads need no flash writes. The mount becomes the current dir.
+
+        :param local_dir:   local directory to serve
+        """
+
+        if not os.path.isdir(local_dir):
+            raise IOError("No such local directory: %s" % local_dir)
+
+        if self.mount_server is not None:
+            self.umount()
+
+        self.mount_server = MountServer(local_dir)
+        self.intercept = (MOUNT_ESCAPE, self.mount_server.handle)
+
+        try:
+
+            self.exec_(FS_HOOK)
+            self.exec_(
+                "os.mount(_FS(), '%s')\r\n"
+                "os.chdir('%s')\r\n" % (MOUNT_POINT, MOUNT_POINT)
+            )
+
+        except PyboardError as e:
+            self.__drop_mount()
+            raise RemoteIOError("Failed to mount %s: %s" % (local_dir, e))
+
+        self.dir = MOUNT_POINT
+
+    def umount(self):
+
+        if self.mount_server is None:
+            raise RemoteIOError("Nothing mounted")
+
+        try:
+
+            self.exec_(
+                "os.chdir('/')\r\n"
+                "os.umount('%s')\r\n" % MOUNT_POINT
+            )
+
+        finally:
+            self.__drop_mount()
+
+        if self.dir.startswith(MOUNT_POINT):
+            self.dir = "/"
+
+    def mpy_cross(self, src, dst=None):
+
+        from mp import mpycross
+        mpycross.compile_file(src, dst)
 
 
 class MpFileExplorerCaching(MpFileExplorer):
 
-    def __init__(self, constr, reset=False):
-        MpFileExplorer.__init__(self, constr, reset)
+    def __init__(self, constr, reset=False, prefetch=False):
+        """
+        Keeps directory listings and stat results (type, size, hash) of the
+        remote files. Operations of this explorer update them in place. Any
+        user code run on the device (exec, execfile, REPL, reset) starts a new
+        generation, which invalidates everything cached before.
+
+        :param prefetch:    fill the cache with the whole remote tree in one
+                            walk whenever the session is set up
+        """
 
+        # setup() runs within the base constructor and may already prefetch
         self.cache = {}
+        self.stats = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.prefetch = prefetch
+
+        MpFileExplorer.__init__(self, constr, reset)
+
+    def setup(self):
+
+        # the REPL or a reconnect may have changed anything
+        self.invalidate()
+        MpFileExplorer.setup(self)
+
+        if self.prefetch:
+            self.prefetch_tree()
+
+    def resume(self):
+
+        self.invalidate()
+        return MpFileExplorer.resume(self)
+
+    def run(self, command, data_consumer=None):
+
+        try:
+            return MpFileExplorer.run(self, command, data_consumer)
+        finally:
+            self.invalidate()
+
+    def invalidate(self):
+
+        self.generation += 1
+
+    def prefetch_tree(self, target="/"):
+        """
+        Cache the listings of every directory below target, walked on the
+        device within a single exec.
+
+        :param target:      remote directory to start at
+        """
+
+        top = self._fqn(target)
+        listings = {top: []}
+
+        for path, kind, _ in self.walk(top):
+            parent, name = posixpath.split(path)
+            listings.setdefault(parent, []).append((name, kind))
+            if kind == 'D':
+                listings.setdefault(path, [])
+
+        for path, files in listings.items():
+            self.__cache(path, files)
+
+        logging.info("prefetched %d directories below '%s'" % (len(listings), top))
+
+    def __mounted(self, path):
+
+        # files below the mount point change on the host at any time
+        return self.mount_server is not None and (path + "/").startswith(MOUNT_POINT + "/")
 
     def __cache(self, path, data):
 
         logging.debug("caching '%s': %s" % (path, data))
-        self.cache[path] = data
+        self.cache[path] = (self.generation, data)
 
     def __cache_hit(self, path):
 
-        if path in self.cache:
-            logging.debug("cache hit for '%s': %s" % (path, self.cache[path]))
-            return self.cache[path]
+        if self.__mounted(path):
+            return None
+
+        if path in self.cache and self.cache[path][0] == self.generation:
+            logging.debug("cache hit for '%s': %s" % (path, self.cache[path][1]))
+            self.hits += 1
+            return self.cache[path][1]
 
+        self.misses += 1
         return None
 
+    def __stat(self, path, kind, size=None, digest=None):
+
+        self.stats[path] = (self.generation, kind, size, digest)
+
+    def __stat_hit(self, path):
+
+        if self.__mounted(path):
+            return None
+
+        if path in self.stats and self.stats[path][0] == self.generation:
+            self.hits += 1
+            return self.stats[path][1:]
+
+        self.misses += 1
+        return None
+
+    def __forget(self, path):
+
+        for p in list(self.stats.keys()):
+            if p == path or p.startswith(path.rstrip("/") + "/"):
+                del self.stats[p]
+
+    def cached_listing(self, target):
+
+        return self.__cache_hit(posixpath.normpath(self._fqn(target)))
+
+    def stat(self, target):
+
+        path = posixpath.normpath(self._fqn(target))
+        hit = self.__stat_hit(path)
+
+        if hit is not None and hit[1] is not None:
+            return hit[:2]
+
+        kind, size = MpFileExplorer.stat(self, path)
+        self.__stat(path, kind, size)
+
+        return kind, size
+
+    def kind(self, target):
+
+        path = posixpath.normpath(self._fqn(target))
+        hit = self.__stat_hit(path)
+
+        if hit is not None:
+            return hit[0]
+
+        # the listing of the parent tells as well
+        parent, name = posixpath.split(path)
+        listing = self.__cache_hit(parent) if path != "/" else None
+
+        if listing is not None:
+            for f in listing:
+                if f[0] == name:
+                    return f[1]
+            raise RemoteIOError("No such file or directory: %s" % path)
+
+        return self.stat(path)[0]
+
+    def walk(self, target=None):
+
+        entries = MpFileExplorer.walk(self, target)
+
+        for path, kind, size in entries:
+            self.__stat(path, kind, size)
+
+        return entries
+
+    def checksums(self, targets, cached=True):
+
+        digests = {}
+        missing = []
+
+        # only digests calculated on the device are remembered
+        for t in targets:
+            path = self._fqn(t)
+            hit = self.__stat_hit(path) if cached else None
+            if hit is not None and hit[2] is not None:
+                digests[path] = hit[2]
+            else:
+                missing.append(path)
+
+        for path, digest in MpFileExplorer.checksums(self, missing).items():
+            hit = self.stats.get(path)
+            self.__stat(path, 'F', hit[2] if hit is not None and hit[0] == self.generation else None, digest)
+            digests[path] = digest
+
+        return digests
+
+    def cd(self, target):
+
+        # a cached listing or stat result proves the directory exists
+        tmp_dir = self._cd_target(target)
+
+        if self.__cache_hit(tmp_dir) is not None:
+            self.dir = tmp_dir
+            return
+
+        try:
+            if self.kind(tmp_dir) == 'D':
+                self.dir = tmp_dir
+                return
+        except RemoteIOError:
+            pass
+
+        # let the device report the error
+        MpFileExplorer.cd(self, target)
+
     def ls(self, add_files=True, add_dirs=True, add_details=False):
 
         hit = self.__cache_hit(self.dir)
@@ -537,66 +2120,174 @@ class MpFileExplorerCaching(MpFileExplorer):
 
         return files
 
-    def put(self, src, dst=None):
+    def put(self, src, dst=None, pipelined=False):
 
-        MpFileExplorer.put(self, src, dst)
+        MpFileExplorer.put(self, src, dst, pipelined)
 
         if dst is None:
             dst = src
 
-        path = posixpath.split(self._fqn(dst))
-        newitm = path[-1]
-        parent = path[:-1][0]
+        self.__cache_add(dst, 'F', os.path.getsize(src))
 
-        hit = self.__cache_hit(parent)
+    def puts(self, dst, lines):
+
+        MpFileExplorer.puts(self, dst, lines)
+        self.__cache_add(dst, 'F')
+
+    def md(self, dir):
+
+        MpFileExplorer.md(self, dir)
+        self.__cache_add(dir, 'D', 0)
+
+    def __known_kind(self, path):
+
+        hit = self.__stat_hit(path)
 
         if hit is not None:
-            if not (dst, 'F') in hit:
-                self.__cache(parent, hit + [(newitm, 'F')])
+            return hit[0]
 
-    def puts(self, dst, lines):
+        parent, name = posixpath.split(path)
+        listing = self.__cache_hit(parent)
 
-        MpFileExplorer.puts(self, dst, lines)
+        for f in listing or []:
+            if f[0] == name:
+                return f[1]
+
+        return None
 
-        path = posixpath.split(self._fqn(dst))
+    def __list_add(self, target, kind):
+
+        path = posixpath.split(self._fqn(target))
         newitm = path[-1]
         parent = path[:-1][0]
 
         hit = self.__cache_hit(parent)
 
         if hit is not None:
-            if not (dst, 'F') in hit:
-                self.__cache(parent, hit + [(newitm, 'F')])
+            if not (newitm, kind) in hit:
+                self.__cache(parent, [f for f in hit if f[0] != newitm] + [(newitm, kind)])
 
-    def md(self, dir):
+    def __cache_add(self, target, kind, size=None, digest=None):
 
-        MpFileExplorer.md(self, dir)
+        # creating a directory which exists keeps what is known below it
+        if kind == 'F':
+            self.__forget(self._fqn(target))
 
-        path = posixpath.split(self._fqn(dir))
-        newitm = path[-1]
+        self.__stat(self._fqn(target), kind, size, digest)
+        self.__list_add(target, kind)
+
+    def __cache_remove(self, target):
+
+        path = posixpath.split(self._fqn(target))
+        rmitm = path[-1]
         parent = path[:-1][0]
 
+        self.__forget(self._fqn(target))
+
         hit = self.__cache_hit(parent)
 
         if hit is not None:
-            if not (dir, 'D') in hit:
-                self.__cache(parent, hit + [(newitm, 'D')])
+            self.__cache(parent, [f for f in hit if f[0] != rmitm])
+
+    def batch(self, ops):
+
+        results = MpFileExplorer.batch(self, ops)
+
+        for (op, _), (path, err) in zip(ops, results):
+            if err is None and op == "md":
+                self.__cache_add(path, 'D', 0)
+            elif err is None and op == "rm":
+                self.cache.pop(path, None)
+                self.__cache_remove(path)
+
+        return results
+
+    def mds(self, targets):
+
+        MpFileExplorer.mds(self, targets)
+
+        for target in targets:
+            self.__cache_add(target, 'D', 0)
+
+    def put_bundle(self, files, verbose=False):
+
+        MpFileExplorer.put_bundle(self, files, verbose)
+
+        for src, dst in files:
+            self.__cache_add(dst, 'F', os.path.getsize(src))
 
     def rm(self, target):
 
         MpFileExplorer.rm(self, target)
+        self.__cache_remove(target)
 
-        path = posixpath.split(self._fqn(target))
-        rmitm = path[-1]
-        parent = path[:-1][0]
+    def cp(self, src, dst):
 
-        hit = self.__cache_hit(parent)
+        hit = self.__stat_hit(self._fqn(src))
+
+        dst = MpFileExplorer.cp(self, src, dst)
+        self.__cache_add(dst, 'F')
 
         if hit is not None:
-            files = []
+            # same content and size, the hash is left to the device
+            self.__stat(dst, 'F', hit[1])
+
+        return dst
+
+    def mv(self, src, dst):
+
+        src = self._fqn(src)
+        kind = self.__known_kind(src)
+
+        dst = MpFileExplorer.mv(self, src, dst)
+
+        # listings and stats below a moved directory stay valid under the new name
+        moved = []
+
+        for store in (self.cache, self.stats):
+            for p in list(store.keys()):
+                if p == src or p.startswith(src.rstrip("/") + "/"):
+                    moved.append((store, dst + p[len(src):], store.pop(p)))
+                    if store is self.cache:
+                        kind = 'D'
+
+        self.__cache_remove(src)
+        self.__forget(dst)
+
+        for store, p, entry in moved:
+            store[p] = entry
 
-            for f in hit:
-                if f[0] != rmitm:
-                    files.append(f)
+        if kind is not None:
+            self.__list_add(dst, kind)
+        else:
+            # unknown kind, let the next listing find out
+            self.cache.pop(posixpath.split(dst)[0], None)
+
+        return dst
+
+    def rmtree(self, target):
+
+        ret = MpFileExplorer.rmtree(self, target)
+
+        path = self._fqn(target)
+
+        for p in list(self.cache.keys()):
+            if p == path or p.startswith(path.rstrip("/") + "/"):
+                del self.cache[p]
+
+        if path == "/":
+            self.stats = {}
+            return ret
+
+        self.__cache_remove(target)
 
-            self.__cache(parent, files)
+        return ret
+
+    def mrm(self, pat, verbose=False):
+
+        files = MpFileExplorer.mrm(self, pat, verbose)
+
+        for f in files:
+            self.__cache_remove(f)
+
+        return files
@@ -23,21 +23,22 @@
 ##
 
 
-import io
 import cmd
 import os
 import argparse
 import glob
 import sys
-import serial
 import logging
 import platform
 import time
+import posixpath
+import threading
 
 from mp import version
 from mp.mpfexp import MpFileExplorer
 from mp.mpfexp import MpFileExplorerCaching
 from mp.mpfexp import RemoteIOError
+from mp.mount import MOUNT_POINT
 from mp.pyboard import PyboardError
 from mp.conbase import ConError
 from mp.tokenizer import Tokenizer
@@ -45,24 +46,34 @@ from mp.tokenizer import Tokenizer
 
 class MpFileShell(cmd.Cmd):
 
-    def __init__(self, color=False, caching=False, reset=False, help=False):
+    def __init__(self, color=False, caching=False, reset=False, help=False, prefetch=False):
         cmd.Cmd.__init__(self)
 
         self.color = color
         self.caching = caching
+        self.prefetch = prefetch
         self.reset = reset
         self.open_args = None
         self.fe = None
         self.repl = None
         self.tokenizer = Tokenizer()
 
+        # force the transfer progress bar on or off, None follows stdout being a tty
+        self.progress_bar = None
+
+        # the completion index is refreshed in the background, commands and
+        # the refresh must never talk to the device at the same time (reentrant,
+        # an empty line repeats the last command from within onecmd)
+        self.device_lock = threading.RLock()
+        self.index_thread = None
+        self.indexed = None
+
         if platform.system() == 'Windows':
             self.use_rawinput = False
 
         if platform.system() == 'Darwin':
             self.reset = True
 
-        self.__intro()
         self.__set_prompt_path()
 
         if help is False:
@@ -81,8 +92,16 @@ class MpFileShell(cmd.Cmd):
     def __del__(self):
         self.__disconnect()
 
+    def preloop(self):
+
+        # only the interactive shell shows the intro, scripts set their own
+        if self.intro is None:
+            self.__intro()
+
     def __intro(self):
 
+        import serial
+
         self.intro = '\n** Micropython File Shell v%s, sw@kaltpost.de & junhuanchen@qq.com **\n' % version.FULL
 
         self.intro += '-- Running on Python %d.%d using PySerial %s --\n' \
@@ -97,6 +116,138 @@ class MpFileShell(cmd.Cmd):
 
         self.prompt = "mpfs [" + pwd + "]> "
 
+    # commands which are merged into one device exec when run from a script
+    BATCH_COMMANDS = ("md", "rm", "cd")
+
+    def onecmd(self, line):
+
+        with self.device_lock:
+            return cmd.Cmd.onecmd(self, line)
+
+    def onecmds(self, lines):
+        """
+        Run several commands in order. Consecutive md, rm and cd commands
+        with a single plain name are sent to the device as one batch, their
+        errors are reported just like when running them one by one.
+
+        :param lines:       list of command lines
+        """
+
+        pending = []
+
+        for line in lines:
+
+            op = self.__batchable(line)
+
+            if op is not None:
+                pending.append((line, op))
+                continue
+
+            self.__run_batch(pending)
+            pending = []
+            self.onecmd(line)
+
+        self.__run_batch(pending)
+
+    def __batchable(self, line):
+
+        if self.fe is None:
+            return None
+
+        command, arg, _ = self.parseline(line)
+
+        if command not in self.BATCH_COMMANDS or not arg:
+            return None
+
+        tokens, rest = self.tokenizer.tokenize(arg)
+
+        # anything unusual (options, several names, bad names) runs on its own
+        if rest != '' or len(tokens) != 1 or tokens[0].value.startswith("-"):
+            return None
+
+        return command, tokens[0].value
+
+    def __run_batch(self, pending):
+
+        if len(pending) < 2:
+            for line, _ in pending:
+                self.onecmd(line)
+            return
+
+        with self.device_lock:
+
+            try:
+                for _, err in self.fe.batch([op for _, op in pending]):
+                    if err is not None:
+                        self.__error(str(err))
+            except IOError as e:
+                self.__error(str(e))
+            except PyboardError:
+                self.__error("Unable to send request to %s" % self.fe.sysname)
+            except Exception as e:
+                print(e)
+
+            self.__set_prompt_path()
+
+    def __complete_remote(self, args, files=True):
+        """
+        Complete remote paths, also nested ones like "lib/dri". Completion
+        never waits for the device: names are served from the listing cache,
+        which is filled by a background walk of the remote tree and kept up
+        to date by put, rm, md and friends.
+        """
+
+        text, line, _, end = args[:4]
+
+        word = line[:end].split(" ")[-1]
+        dir_part, base = posixpath.split(word)
+
+        if self.fe is None:
+            return []
+
+        listing = self.fe.cached_listing(dir_part)
+
+        if listing is None:
+            if self.caching:
+                self.__refresh_index()
+                return []
+            elif len(dir_part):
+                return []
+            # nothing cached without caching, ask the device for the current dir
+            try:
+                listing = self.fe.ls(add_details=True)
+            except Exception:
+                return []
+
+        names = [posixpath.join(dir_part, n) + ("/" if k == 'D' else "") for n, k in listing
+                 if n.startswith(base) and (files or k == 'D')]
+
+        # readline may have split the word at "/", only complete the last part
+        return [n[len(word) - len(text):] for n in names]
+
+    def __refresh_index(self):
+
+        # user code run on the device starts a new cache generation, index again then
+        if self.indexed == (self.fe, self.fe.generation) or \
+                (self.index_thread is not None and self.index_thread.is_alive()):
+            return
+
+        def refresh(fe):
+
+            with self.device_lock:
+                if fe is not self.fe:
+                    return
+                try:
+                    fe.prefetch_tree()
+                except Exception as e:
+                    logging.warning("failed to index remote files: %s" % e)
+
+                self.indexed = (fe, fe.generation)
+
+        self.index_thread = threading.Thread(target=refresh, args=(self.fe,))
+        self.index_thread.daemon = True
+        self.index_thread.start()
+
     def __error(self, msg):
 
         print('\n' + msg + '\n')
@@ -110,9 +261,10 @@ class MpFileShell(cmd.Cmd):
             # if self.reset:
             #     print("Hard resetting device ...")
             if self.caching:
-                self.fe = MpFileExplorerCaching(port, self.reset)
+                self.fe = MpFileExplorerCaching(port, self.reset, self.prefetch)
             else:
                 self.fe = MpFileExplorer(port, self.reset)
+            self.fe.progress.interactive = self.progress_bar
             print("Connected to %s" % self.fe.sysname)
             self.__set_prompt_path()
         except PyboardError as e:
@@ -171,6 +323,15 @@ class MpFileShell(cmd.Cmd):
 
         return None
 
+    def __split_flags(self, s_args, allowed):
+
+        flags = []
+
+        while len(s_args) and s_args[0] in allowed:
+            flags.append(s_args.pop(0))
+
+        return flags, s_args
+
     def all_serial(self):
         import serial.tools.list_ports
         print("looking for all port...")
@@ -312,13 +473,7 @@ class MpFileShell(cmd.Cmd):
                 print(e)
 
     def complete_cd(self, *args):
-
-        try:
-            files = self.fe.ls(add_files=False)
-        except Exception:
-            files = []
-
-        return [i for i in files if i.startswith(args[0])]
+        return self.__complete_remote(args, files=False)
 
     def do_md(self, args):
         """md <TARGET DIR>
@@ -341,6 +496,51 @@ class MpFileShell(cmd.Cmd):
             except Exception as e:
                 print(e)
 
+    def do_mount(self, args):
+        """mount <LOCAL DIR>
+        Mount a local directory on the device at /remote and change into it.
+        Scripts on the board then import and read files straight from the
+        host, nothing is written to flash. Use "umount" to stop.
+
+        The mount is only served while mpfshell runs a command, "repl"
+        unmounts it before handing over the board.
+        """
+
+        if not len(args):
+            self.__error("Missing argument: <LOCAL DIR>")
+        elif self.__is_open():
+            try:
+                s_args = self.__parse_file_names(args)
+                if not s_args:
+                    return
+                elif len(s_args) > 1:
+                    self.__error("Only one argument allowed: <LOCAL DIR>")
+                    return
+
+                self.fe.mount(s_args[0])
+                self.__set_prompt_path()
+            except IOError as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
+
+    def complete_mount(self, *args):
+        return self.complete_lcd(*args)
+
+    def do_umount(self, args):
+        """umount
+        Unmount the local directory mounted with "mount".
+        """
+
+        if self.__is_open():
+            try:
+                self.fe.umount()
+                self.__set_prompt_path()
+            except IOError as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
+
     def do_lls(self, args):
         """lls
         List files in current local directory.
@@ -391,11 +591,35 @@ class MpFileShell(cmd.Cmd):
 
         print(os.getcwd())
 
+    def __print_transfer_report(self, report):
+
+        count, size, secs = report
+
+        if secs > 0:
+            print("\n%d files, %d bytes in %.2f s (%.2f KB/s)\n" % (count, size, secs, size / 1024.0 / secs))
+        else:
+            print("\n%d files, %d bytes\n" % (count, size))
+
     def do_put(self, args):
-        """put <LOCAL FILE> [<REMOTE FILE>]
+        """put [-r [-b]] [-p] [--minify] [--verify] <LOCAL FILE> [<REMOTE FILE>]
         Upload local file. If the second parameter is given,
         its value is used for the remote file name. Otherwise the
         remote file will be named the same as the local file.
+
+        With "-r" a local directory is uploaded recursively, including
+        all sub-directories (except hidden ones like .git, __pycache__ and
+        editor backups). Adding "-b" sends all files as one bundle,
+        which is much faster for many small files.
+
+        With "-p" data is streamed to the device in one go, without a
+        round trip per chunk (pipelined upload). This needs a link with
+        flow control, e.g. native USB, telnet or WebREPL.
+
+        With "--minify" comments, docstrings and indentation are stripped
+        from Python files before upload. Line numbers stay the same.
+
+        With "--verify" the SHA256 of every uploaded file is calculated on
+        the device and compared with the local one.
         """
 
         if not len(args):
@@ -406,6 +630,29 @@ class MpFileShell(cmd.Cmd):
             s_args = self.__parse_file_names(args)
             if not s_args:
                 return
+
+            flags, s_args = self.__split_flags(s_args, ("-r", "-b", "-p", "--minify", "--verify"))
+            pipelined = "-p" in flags
+            minify = "--minify" in flags
+            verify = "--verify" in flags
+            put = self.fe.put_verified if verify else self.fe.put
+
+            if "-r" in flags or "-b" in flags:
+                if "-r" not in flags or len(s_args) < 1 or len(s_args) > 2:
+                    self.__error("Only one ore two arguments allowed: "
+                                 "-r [-b] [-p] [--minify] [--verify] <LOCAL DIR> [<REMOTE DIR>]")
+                    return
+                try:
+                    self.__print_transfer_report(self.fe.put_tree(s_args[0], s_args[1] if len(s_args) > 1 else None,
+                                                                  True, "-b" in flags, pipelined, minify, verify))
+                except IOError as e:
+                    self.__error(str(e))
+                except Exception as e:
+                    print(e)
+                return
+            elif not len(s_args):
+                self.__error("Missing arguments: <LOCAL FILE> [<REMOTE FILE>]")
+                return
             elif len(s_args) > 2:
                 self.__error("Only one ore two arguments allowed: <LOCAL FILE> [<REMOTE FILE>]")
                 return
@@ -430,15 +677,157 @@ class MpFileShell(cmd.Cmd):
                     self.fe.cd(lfile_name)
                     # cd dir get files to put
                     os.chdir(lfile_name)
-                    for f in os.listdir("."):
-                        if os.path.isfile(f):
-                            self.fe.put(f, f)
-                    self.fe.cd(remote)
-                    os.chdir(local) # restore
+                    try:
+                        files = [f for f in os.listdir(".") if os.path.isfile(f)]
+                        # fail before anything is written if they do not fit
+                        self.fe.preflight([(os.path.getsize(f), f) for f in files])
+                        for f in files:
+                            put(f, f, pipelined)
+                    finally:
+                        self.fe.cd(remote)
+                        os.chdir(local) # restore
 
                 if os.path.isfile(lfile_name):
                     print("       %s" % lfile_name)
-                    self.fe.put(lfile_name, rfile_name)           
+                    if minify and lfile_name.endswith(".py"):
+                        from mp.minify import minify_file
+                        lfile_name = minify_file(lfile_name)
+                    self.fe.preflight([(os.path.getsize(lfile_name), rfile_name)])
+                    put(lfile_name, rfile_name, pipelined)
+                    if verify:
+                        print("       verified")
+            except IOError as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
+
+    def do_watch(self, args):
+        """watch [-r] <LOCAL DIR> [<REMOTE DIR>]
+        Watch a local directory and upload every file as soon as it changes.
+        Bursts of changes are collected and sent together. The files go to
+        the given remote directory, or to the current one if omitted.
+
+        With "-r" the board is soft reset after each upload, which runs
+        main.py. Its output is shown until the next change arrives.
+
+        Stop watching with Ctrl+C.
+        """
+
+        if not len(args):
+            self.__error("Missing arguments: <LOCAL DIR> [<REMOTE DIR>]")
+
+        elif self.__is_open():
+
+            s_args = self.__parse_file_names(args)
+            if not s_args:
+                return
+
+            flags, s_args = self.__split_flags(s_args, ("-r",))
+
+            if len(s_args) < 1 or len(s_args) > 2:
+                self.__error("Only one ore two arguments allowed: [-r] <LOCAL DIR> [<REMOTE DIR>]")
+                return
+            elif not os.path.isdir(s_args[0]):
+                self.__error("No such local directory: %s" % s_args[0])
+                return
+
+            from mp.watcher import Watcher
+
+            src_dir = s_args[0]
+            dst_dir = self.fe._fqn(s_args[1]) if len(s_args) > 1 else self.fe.pwd()
+            watcher = Watcher(src_dir)
+            running = False
+
+            print("Watching '%s', uploading to '%s' (Ctrl+C to stop) ..." % (src_dir, dst_dir))
+
+            try:
+                while True:
+                    files = watcher.changes(0.1 if running else None)
+
+                    if running:
+                        while self.fe.con.inWaiting() > 0:
+                            sys.stdout.write(self.fe.con.read(self.fe.con.inWaiting()).decode("utf-8", "replace"))
+                        sys.stdout.flush()
+
+                    if not len(files):
+                        continue
+
+                    if running:
+                        # interrupt main.py and get back into the raw REPL
+                        self.fe.setup()
+                        running = False
+
+                    print("\n%s" % ", ".join(files))
+                    start = time.time()
+
+                    try:
+                        self.fe.put_files([(os.path.join(src_dir, f),
+                                            posixpath.join(dst_dir, f.replace(os.sep, "/"))) for f in files],
+                                          dst_root=dst_dir)
+                    except IOError as e:
+                        self.__error(str(e))
+                        continue
+
+                    print("uploaded %d files in %.2f s" % (len(files), time.time() - start))
+
+                    if "-r" in flags:
+                        self.fe.exit_raw_repl()
+                        self.fe.con.write(b'\x04')
+                        running = True
+
+            except KeyboardInterrupt:
+                print("")
+            except PyboardError as e:
+                self.__error(str(e))
+            finally:
+                watcher.close()
+                if running:
+                    self.fe.setup()
+
+    def do_deploy(self, args):
+        """deploy [-n] [--entry <SCRIPT>] <LOCAL DIR> [<REMOTE DIR>]
+        Compile, compare and upload a local project tree in one go.
+        Python files (except boot.py and main.py) are compiled with mpy-cross
+        while files which are already done are uploaded. Files with the same
+        hash on the device are skipped. The files go to the given remote
+        directory, or to the current one if omitted.
+
+        With "-n" nothing is compiled, all files are uploaded as they are.
+
+        With "--entry" only the entry script (relative to the local dir) and
+        the local modules it imports, directly or indirectly, are deployed.
+        """
+
+        if not len(args):
+            self.__error("Missing arguments: <LOCAL DIR> [<REMOTE DIR>]")
+
+        elif self.__is_open():
+
+            s_args = self.__parse_file_names(args)
+            if not s_args:
+                return
+
+            entry = None
+
+            if "--entry" in s_args:
+                i = s_args.index("--entry")
+                if i + 1 >= len(s_args):
+                    self.__error("Missing argument: --entry <SCRIPT>")
+                    return
+                entry = s_args[i + 1]
+                s_args = s_args[:i] + s_args[i + 2:]
+
+            flags, s_args = self.__split_flags(s_args, ("-n",))
+
+            if len(s_args) < 1 or len(s_args) > 2:
+                self.__error("Only one ore two arguments allowed: [-n] [--entry <SCRIPT>] <LOCAL DIR> [<REMOTE DIR>]")
+                return
+
+            try:
+                uploaded, unchanged, size, secs = self.fe.deploy(s_args[0], s_args[1] if len(s_args) > 1 else None,
+                                                                 "-n" not in flags, verbose=True, entry=entry)
+                self.__print_transfer_report((uploaded, size, secs))
+                print("%d files unchanged\n" % unchanged)
             except IOError as e:
                 self.__error(str(e))
             except Exception as e:
@@ -449,30 +838,39 @@ class MpFileShell(cmd.Cmd):
         return [i for i in files if i.startswith(args[0])]
 
     def do_mput(self, args):
-        """mput <SELECTION REGEX>
+        """mput [-b] <SELECTION REGEX>
         Upload all local files that match the given regular expression.
         The remote files will be named the same as the local files.
+        With "-b" all files are sent as one bundle.
 
         "mput" does not get directories, and it is not recursive.
         """
 
+        bundle = args.startswith("-b ")
+
+        if bundle:
+            args = args[3:].strip()
+
         if not len(args):
             self.__error("Missing argument: <SELECTION REGEX>")
 
         elif self.__is_open():
 
             try:
-                self.fe.mput(os.getcwd(), args, True)
+                self.fe.mput(os.getcwd(), args, True, bundle)
             except IOError as e:
                 self.__error(str(e))
             except Exception as e:
                 print(e)
 
     def do_get(self, args):
-        """get <REMOTE FILE> [<LOCAL FILE>]
+        """get [-r] <REMOTE FILE> [<LOCAL FILE>]
         Download remote file. If the second parameter is given,
         its value is used for the local file name. Otherwise the
         locale file will be named the same as the remote file.
+
+        With "-r" a remote directory is downloaded recursively, including
+        all sub-directories.
         """
 
         if not len(args):
@@ -483,6 +881,17 @@ class MpFileShell(cmd.Cmd):
             s_args = self.__parse_file_names(args)
             if not s_args:
                 return
+            elif s_args[0] == "-r":
+                if len(s_args) < 2 or len(s_args) > 3:
+                    self.__error("Only one ore two arguments allowed: -r <REMOTE DIR> [<LOCAL DIR>]")
+                    return
+                try:
+                    self.__print_transfer_report(self.fe.get_tree(s_args[1], s_args[2] if len(s_args) > 2 else None, True))
+                except IOError as e:
+                    self.__error(str(e))
+                except Exception as e:
+                    print(e)
+                return
             elif len(s_args) > 2:
                 self.__error("Only one ore two arguments allowed: <REMOTE FILE> [<LOCAL FILE>]")
                 return
@@ -522,19 +931,15 @@ class MpFileShell(cmd.Cmd):
                 print(e)
 
     def complete_get(self, *args):
-
-        try:
-            files = self.fe.ls(add_dirs=False)
-        except Exception:
-            files = []
-
-        return [i for i in files if i.startswith(args[0])]
+        return self.__complete_remote(args)
 
     def do_rm(self, args):
-        """rm <REMOTE FILE or DIR>
+        """rm [-r] <REMOTE FILE or DIR>
         Delete a remote file or directory.
 
-        Note: only empty directories could be removed.
+        Note: only empty directories could be removed, unless "-r" is given.
+        With "-r" the directory and everything below it is deleted on the
+        device in one go.
         """
 
         if not len(args):
@@ -544,12 +949,19 @@ class MpFileShell(cmd.Cmd):
             s_args = self.__parse_file_names(args)
             if not s_args:
                 return
-            elif len(s_args) > 1:
+
+            flags, s_args = self.__split_flags(s_args, ("-r",))
+
+            if len(s_args) != 1:
                 self.__error("Only one argument allowed: <REMOTE FILE>")
                 return
 
             try:
-                self.fe.rm(s_args[0])
+                if "-r" in flags:
+                    files, dirs = self.fe.rmtree(s_args[0])
+                    print("Removed %d files and %d directories" % (files, dirs))
+                else:
+                    self.fe.rm(s_args[0])
             except IOError as e:
                 self.__error(str(e))
             except PyboardError:
@@ -570,20 +982,246 @@ class MpFileShell(cmd.Cmd):
         elif self.__is_open():
 
             try:
-                self.fe.mrm(args, True)
+                files = self.fe.mrm(args, True)
+                print("Removed %d files" % len(files))
             except IOError as e:
                 self.__error(str(e))
             except Exception as e:
                 print(e)
 
     def complete_rm(self, *args):
+        return self.__complete_remote(args)
 
-        try:
-            files = self.fe.ls()
-        except Exception:
-            files = []
+    def do_cp(self, args):
+        """cp <REMOTE FILE> <REMOTE FILE or DIR>
+        Copy a remote file on the device.
+        """
 
-        return [i for i in files if i.startswith(args[0])]
+        self.__copy_or_move(args, self.fe.cp if self.fe is not None else None)
+
+    def do_mv(self, args):
+        """mv <REMOTE FILE or DIR> <REMOTE FILE or DIR>
+        Move or rename a remote file or directory on the device.
+        """
+
+        self.__copy_or_move(args, self.fe.mv if self.fe is not None else None)
+
+    def __copy_or_move(self, args, op):
+
+        if not len(args):
+            self.__error("Missing arguments: <REMOTE SOURCE> <REMOTE TARGET>")
+        elif self.__is_open():
+
+            s_args = self.__parse_file_names(args)
+            if not s_args:
+                return
+            elif len(s_args) != 2:
+                self.__error("Exactly two arguments needed: <REMOTE SOURCE> <REMOTE TARGET>")
+                return
+
+            try:
+                op(s_args[0], s_args[1])
+            except IOError as e:
+                self.__error(str(e))
+            except PyboardError:
+                self.__error("Unable to send request to %s" % self.fe.sysname)
+            except Exception as e:
+                print(e)
+
+    def complete_cp(self, *args):
+        return self.complete_rm(*args)
+
+    def complete_mv(self, *args):
+        return self.complete_rm(*args)
+
+    def do_find(self, args):
+        """find <PATTERN> [<REMOTE DIR>]
+        Find remote files and directories whose name matches a shell
+        pattern ("*" and "?"), searching below the current or the given
+        directory. The search runs on the device, matches show up as they
+        are found.
+        """
+
+        self.__search(args, "<PATTERN> [<REMOTE DIR>]", 1,
+                      lambda a, cb: self.fe.find(a[0], a[1] if len(a) > 1 else None, cb))
+
+    def do_grep(self, args):
+        """grep <REGEX> <REMOTE FILE or DIR>
+        Print the lines of remote files matching a regular expression,
+        directories are searched recursively. The search runs on the device,
+        matches show up as they are found.
+        """
+
+        self.__search(args, "<REGEX> <REMOTE FILE or DIR>", 2,
+                      lambda a, cb: self.fe.grep(a[0], a[1], cb))
+
+    def __search(self, args, usage, required, op):
+
+        if not len(args):
+            self.__error("Missing arguments: %s" % usage)
+        elif self.__is_open():
+
+            # patterns are no file names, so take the first argument as it is
+            args = args.strip()
+            if args.startswith('"') and '"' in args[1:]:
+                pattern, rest = args[1:].split('"', 1)
+            else:
+                pattern, _, rest = args.partition(" ")
+
+            s_args = [pattern]
+
+            if len(rest.strip()):
+                names = self.__parse_file_names(rest.strip())
+                if not names:
+                    return
+                s_args += names
+
+            if len(s_args) < required or len(s_args) > 2:
+                self.__error("Wrong number of arguments: %s" % usage)
+                return
+
+            def found(line):
+                print(line)
+
+            try:
+                op(s_args, found)
+            except KeyboardInterrupt:
+                self.fe.keyboard_interrupt()
+                self.fe.resume()
+                print("")
+            except IOError as e:
+                self.__error(str(e))
+            except PyboardError as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
+
+    def do_df(self, args):
+        """df [<REMOTE DIR>]
+        Show size and free space of the remote file system holding the
+        current or the given directory.
+        """
+
+        if self.__is_open():
+
+            s_args = self.__parse_file_names(args) if len(args) else [None]
+            if not s_args:
+                return
+            elif len(s_args) > 1:
+                self.__error("Only one argument allowed: [<REMOTE DIR>]")
+                return
+
+            try:
+                bsize, total, free = self.fe.df(s_args[0])
+                if total:
+                    print("%d KB total, %d KB used, %d KB free (%d%% used, %d byte blocks)"
+                          % (total // 1024, (total - free) // 1024, free // 1024,
+                             100 * (total - free) // total, bsize))
+                else:
+                    print("File system size unknown")
+            except IOError as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
+
+    def do_du(self, args):
+        """du [<REMOTE FILE or DIR>]
+        Show the total size of a remote file or directory tree, defaults to
+        the current directory.
+        """
+
+        if self.__is_open():
+
+            s_args = self.__parse_file_names(args) if len(args) else [None]
+            if not s_args:
+                return
+            elif len(s_args) > 1:
+                self.__error("Only one argument allowed: [<REMOTE FILE or DIR>]")
+                return
+
+            try:
+                size, files, dirs = self.fe.du(s_args[0])
+                print("%d bytes in %d files and %d directories" % (size, files, dirs))
+            except IOError as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
+
+    def do_cache(self, args):
+        """cache [clear]
+        Show how often the cache of remote listings and file details was
+        used, or drop everything it holds with "clear".
+        """
+
+        if self.__is_open():
+
+            if not self.caching:
+                self.__error("Caching is disabled")
+            elif args.strip() == "clear":
+                self.fe.invalidate()
+            elif len(args.strip()):
+                self.__error("Unknown argument: %s" % args)
+            else:
+                total = self.fe.hits + self.fe.misses
+                print("%d hits, %d misses (%d%% hit rate), generation %d"
+                      % (self.fe.hits, self.fe.misses, 100 * self.fe.hits // total if total else 0,
+                         self.fe.generation))
+
+    def do_sha256(self, args):
+        """sha256 <REMOTE FILE>
+        Print the SHA256 of a remote file, calculated on the device.
+        """
+
+        if not len(args):
+            self.__error("Missing argument: <REMOTE FILE>")
+        elif self.__is_open():
+
+            s_args = self.__parse_file_names(args)
+            if not s_args:
+                return
+            elif len(s_args) > 1:
+                self.__error("Only one argument allowed: <REMOTE FILE>")
+                return
+
+            try:
+                print("%s  %s" % (self.fe.sha256(s_args[0]), s_args[0]))
+            except IOError as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
+
+    complete_sha256 = complete_get
+
+    def do_verify(self, args):
+        """verify <LOCAL FILE> [<REMOTE FILE>]
+        Check that a remote file has the same content as a local one by
+        comparing their SHA256. Nothing is downloaded. The remote file is
+        named the same as the local file if omitted.
+        """
+
+        if not len(args):
+            self.__error("Missing arguments: <LOCAL FILE> [<REMOTE FILE>]")
+        elif self.__is_open():
+
+            s_args = self.__parse_file_names(args)
+            if not s_args:
+                return
+            elif len(s_args) > 2:
+                self.__error("Only one ore two arguments allowed: <LOCAL FILE> [<REMOTE FILE>]")
+                return
+
+            src = s_args[0]
+            dst = s_args[1] if len(s_args) > 1 else src
+
+            try:
+                if len(self.fe.verify_files([(src, dst)])):
+                    self.__error("Files differ: %s %s" % (src, dst))
+                else:
+                    print("OK")
+            except IOError as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
 
     def do_c(self, args):
         self.do_cat(args)
@@ -613,12 +1251,143 @@ class MpFileShell(cmd.Cmd):
 
     complete_cat = complete_get
 
+    # bytes fetched per round trip while looking for line ends
+    LINE_BLOCK_SIZE = 1024
+
+    def __parse_lines_args(self, args, flags=()):
+
+        s_args = self.__parse_file_names(args)
+        if not s_args:
+            return None
+
+        lines = 10
+        opts = []
+
+        while len(s_args) > 1 and s_args[0].startswith("-"):
+            a = s_args.pop(0)
+            if a == "-n":
+                lines = int(s_args.pop(0))
+            elif a in flags:
+                opts.append(a)
+            else:
+                raise ValueError("Unknown option: %s" % a)
+
+        if len(s_args) != 1:
+            raise ValueError("Only one argument allowed: <REMOTE FILE>")
+
+        return opts, lines, s_args[0]
+
+    def do_head(self, args):
+        """head [-n <LINES>] <REMOTE FILE>
+        Print the first lines (default 10) of a remote file. Only the needed
+        part of the file is transferred.
+        """
+
+        if not len(args):
+            self.__error("Missing argument: <REMOTE FILE>")
+        elif self.__is_open():
+
+            try:
+                parsed = self.__parse_lines_args(args)
+                if not parsed:
+                    return
+                _, lines, target = parsed
+
+                data = b""
+                size = None
+
+                while data.count(b"\n") < lines and (size is None or len(data) < size):
+                    block, size = self.fe.read_range(target, len(data), self.LINE_BLOCK_SIZE)
+                    if not len(block):
+                        break
+                    data += block
+
+                data = b"".join(data.splitlines(True)[:lines])
+                sys.stdout.write(data.decode("utf-8", "replace"))
+                sys.stdout.flush()
+
+            except (IOError, ValueError) as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
+
+    def do_tail(self, args):
+        """tail [-f] [-n <LINES>] <REMOTE FILE>
+        Print the last lines (default 10) of a remote file. Only the needed
+        part of the file is transferred.
+
+        With "-f" the file is watched for growth (by comparing its size)
+        and new data is printed as it arrives. Stop with Ctrl+C.
+        """
+
+        if not len(args):
+            self.__error("Missing argument: <REMOTE FILE>")
+        elif self.__is_open():
+
+            try:
+                parsed = self.__parse_lines_args(args, ("-f",))
+                if not parsed:
+                    return
+                opts, lines, target = parsed
+
+                size = self.fe.size(target)
+                start = size
+                data = b""
+
+                # the last line may lack its newline, so look for one more
+                while start > 0:
+                    start = max(0, start - self.LINE_BLOCK_SIZE)
+                    data, size = self.fe.read_range(target, start, size - start)
+                    if data.count(b"\n") > lines:
+                        break
+
+                data = b"".join(data.splitlines(True)[-lines:]) if lines else b""
+                sys.stdout.write(data.decode("utf-8", "replace"))
+                sys.stdout.flush()
+
+                if "-f" in opts:
+                    self.__follow(target, size)
+
+            except (IOError, ValueError) as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
+
+    def __follow(self, target, pos):
+
+        try:
+            while True:
+                size = self.fe.size(target)
+
+                if size < pos:
+                    # truncated or rotated, start over
+                    pos = 0
+
+                if size > pos:
+                    data, _ = self.fe.read_range(target, pos, size - pos)
+                    pos += len(data)
+                    sys.stdout.write(data.decode("utf-8", "replace"))
+                    sys.stdout.flush()
+                else:
+                    time.sleep(0.5)
+
+        except KeyboardInterrupt:
+            # a request may have been cut short, drop its output
+            self.fe.resume()
+            print("")
+
+    complete_head = complete_get
+    complete_tail = complete_get
+
     def do_rf(self, args):
         self.do_runfile(args)
 
     def do_runfile(self, args):
-        """runfile(rf) <LOCAL FILE>
+        """runfile(rf) [--ram] <LOCAL FILE>
         download and running local file in board.
+
+        With "--ram" the file is not stored on the board, it is sent
+        straight into the REPL and executed from RAM.
         """
 
         if not len(args):
@@ -629,20 +1398,50 @@ class MpFileShell(cmd.Cmd):
             s_args = self.__parse_file_names(args)
             if not s_args:
                 return
-            elif len(s_args) > 1:
+
+            flags, s_args = self.__split_flags(s_args, ("--ram",))
+
+            if len(s_args) != 1:
                 self.__error("Only one ore one arguments allowed: <LOCAL FILE> ")
                 return
 
             lfile_name = s_args[0]
 
+            if "--ram" in flags:
+                self.__exec_local(lfile_name)
+                return
+
             try:
                 self.fe.put(lfile_name, lfile_name)
-                self.do_ef(args)
+                self.do_ef(lfile_name)
             except IOError as e:
                 self.__error(str(e))
             except Exception as e:
                 print(e)
 
+    def __exec_local(self, lfile_name):
+
+        try:
+            ret = self.fe.exec_local(lfile_name, self.__data_consumer)
+
+            if len(ret[-1]):
+                self.__error(str(ret[-1].decode('utf-8')))
+
+        except KeyboardInterrupt as e:
+            self.fe.keyboard_interrupt()
+            print(e)
+            try:
+                # collect the traceback of the interrupted script
+                self.fe.follow(2)
+            except PyboardError:
+                self.fe.enter_raw_repl()
+        except IOError as e:
+            self.__error(str(e))
+        except PyboardError as e:
+            self.__error(str(e))
+        except Exception as e:
+            print(e)
+
     def do_ef(self, args):
         self.do_execfile(args)
 
@@ -664,10 +1463,22 @@ class MpFileShell(cmd.Cmd):
             except Exception as e:
                 print(e)
             finally:
-                if (self.open_args.startswith("ser:")):
-                    self.__reconnect()
-                if (self.__is_open()):
-                    self.fe.enter_raw_repl()
+                self.__resume()
+
+    def __resume(self):
+
+        try:
+            if self.fe.resume():
+                self.__set_prompt_path()
+            return
+        except (PyboardError, IOError, OSError) as e:
+            logging.warning("unable to resume session: %s" % e)
+
+        # the board is gone (e.g. hard reset of a USB device), start over
+        if (self.open_args.startswith("ser:")):
+            self.__reconnect()
+        elif (self.__is_open()):
+            self.fe.enter_raw_repl()
 
     def do_lef(self, args):
         self.do_lexecfile(args)
@@ -697,6 +1508,10 @@ class MpFileShell(cmd.Cmd):
             except Exception as e:
                 print(e)
 
+    def __data_consumer(self, data):
+        data = str(data.decode('utf-8'))
+        sys.stdout.write(data.strip("\x04"))
+
     def do_e(self, args):
         self.do_exec(args)
 
@@ -705,17 +1520,12 @@ class MpFileShell(cmd.Cmd):
         Execute a Python CODE on remote.
         """
 
-        def data_consumer(data):
-            data = str(data.decode('utf-8'))
-            sys.stdout.write(data.strip("\x04"))
-
         if not len(args):
             self.__error("Missing argument: <Python CODE>")
         elif self.__is_open():
 
             try:
-                self.fe.exec_raw_no_follow(args + "\n")
-                ret = self.fe.follow(None, data_consumer)
+                ret = self.fe.run(args + "\n", self.__data_consumer)
 
                 if len(ret[-1]):
                     self.__error(str(ret[-1].decode('utf-8')))
@@ -762,6 +1572,15 @@ class MpFileShell(cmd.Cmd):
             else:
                 self.repl.serial = self.fe.con
 
+            # nobody would answer the requests of the mount within the terminal
+            if self.fe.mount_server is not None:
+                try:
+                    self.fe.umount()
+                    print("Unmounted %s" % MOUNT_POINT)
+                except Exception as e:
+                    print(e)
+                self.__set_prompt_path()
+
             self.fe.teardown()
             self.repl.start()
 
@@ -785,12 +1604,48 @@ class MpFileShell(cmd.Cmd):
 
     def do_mpyc(self, args):
         """mpyc <LOCAL PYTHON FILE>
+        mpyc -r <LOCAL DIR> [<MPY-CROSS OPTIONS>]
         Compile a Python file into byte-code by using mpy-cross (which needs to be in the path).
         The compiled file has the same name as the original file but with extension '.mpy'.
+
+        With "-r" all Python files below the directory (except boot.py and main.py)
+        are compiled in parallel. Results are cached by source hash, mpy-cross
+        version and options (e.g. -march=xtensawin), so unchanged files are
+        not compiled again.
         """
 
         if not len(args):
             self.__error("Missing argument: <LOCAL FILE>")
+
+        elif args == "-r" or args.startswith("-r "):
+
+            # the directory is a file name (quotes allowed), the mpy-cross
+            # options (e.g. -march=xtensawin) are passed as they are
+            rest = args[3:].strip()
+            if rest.startswith('"') and '"' in rest[1:]:
+                end = rest.index('"', 1) + 1
+            else:
+                end = len(rest.partition(" ")[0])
+
+            if not end or rest.startswith("-"):
+                self.__error("Missing argument: -r <LOCAL DIR>")
+                return
+
+            s_args = self.__parse_file_names(rest[:end])
+            if not s_args:
+                return
+
+            from mp import mpycross
+
+            try:
+                start = time.time()
+                compiled, cached = mpycross.compile_tree(s_args[0], rest[end:].split(), verbose=True)
+                print("\n%d compiled, %d cached in %.2f s\n" % (compiled, cached, time.time() - start))
+            except IOError as e:
+                self.__error(str(e))
+            except Exception as e:
+                print(e)
+
         else:
 
             s_args = self.__parse_file_names(args)
@@ -800,8 +1655,10 @@ class MpFileShell(cmd.Cmd):
                 self.__error("Only one argument allowed: <LOCAL FILE>")
                 return
 
+            from mp import mpycross
+
             try:
-                self.fe.mpy_cross(s_args[0])
+                mpycross.compile_file(s_args[0])
             except IOError as e:
                 self.__error(str(e))
             except Exception as e:
@@ -821,6 +1678,8 @@ def main():
 
     parser.add_argument("--nocolor", help="disable color", action="store_true", default=False)
     parser.add_argument("--nocache", help="disable cache", action="store_true", default=False)
+    parser.add_argument("--prefetch", help="read the whole remote directory tree into the cache on connect",
+                        action="store_true", default=False)
     parser.add_argument("--nohelp", help="disable help", action="store_true", default=False)
 
     parser.add_argument("--logfile", help="write log to file", default=None)
@@ -842,10 +1701,20 @@ def main():
         logging.basicConfig(format=format, level=logging.CRITICAL)
 
     logging.info('Micropython File Shell v%s started' % version.FULL)
-    logging.info('Running on Python %d.%d using PySerial %s' \
-                 % (sys.version_info[0], sys.version_info[1], serial.VERSION))
 
-    mpfs = MpFileShell(not args.nocolor, not args.nocache, args.reset, args.nohelp)
+    if args.logfile is not None:
+        import serial
+        logging.info('Running on Python %d.%d using PySerial %s' \
+                     % (sys.version_info[0], sys.version_info[1], serial.VERSION))
+
+    # scripted runs skip the help text and the port scan
+    scripted = args.command is not None or args.script is not None
+
+    mpfs = MpFileShell(not args.nocolor, not args.nocache, args.reset, args.nohelp or scripted, args.prefetch)
+
+    # no progress bar unless someone is watching the shell
+    if scripted or args.noninteractive:
+        mpfs.progress_bar = False
 
     if args.open is not None:
         if args.board is None:
@@ -857,30 +1726,18 @@ def main():
 
     if args.command is not None:
 
-        for cmd in ' '.join(args.command).split(';'):
-            scmd = cmd.strip()
-            if len(scmd) > 0 and not scmd.startswith('#'):
-                mpfs.onecmd(scmd)
+        mpfs.onecmds([cmd.strip() for cmd in ' '.join(args.command).split(';')
+                      if len(cmd.strip()) > 0 and not cmd.strip().startswith('#')])
 
     elif args.script is not None:
 
-        f = open(args.script, 'r')
-        script = ""
-
-        for line in f:
-
-            sline = line.strip()
-
-            if len(sline) > 0 and not sline.startswith('#'):
-                script += sline + '\n'
-
-        if sys.version_info < (3, 0):
-            sys.stdin = io.StringIO(script.decode('utf-8'))
-        else:
-            sys.stdin = io.StringIO(script)
+        with open(args.script, 'r') as f:
+            mpfs.onecmds([line.strip() for line in f
+                          if len(line.strip()) > 0 and not line.strip().startswith('#')])
 
-        mpfs.intro = ''
-        mpfs.prompt = ''
+        # like reaching the end of input in the shell
+        mpfs.do_quit(None)
+        return
 
     if not args.noninteractive:
 
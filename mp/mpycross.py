@@ -0,0 +1,188 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import os
+import shutil
+import tempfile
+import hashlib
+import logging
+import subprocess
+
+# compiled files are kept here, named after the hash of everything that
+# influences the output (source, mpy-cross version and arguments)
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".mpfshell_mpy")
+
+_version = None
+
+
+def mpy_cross_version():
+    """
+    :return:            version string reported by mpy-cross (queried once)
+    """
+
+    global _version
+
+    if _version is None:
+        try:
+            _version = subprocess.check_output(["mpy-cross", "--version"]).decode("utf-8").strip()
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise IOError("mpy-cross not found: %s" % e)
+
+    return _version
+
+
+def mpy_name(src):
+    return os.path.splitext(src)[0] + ".mpy"
+
+
+def cache_key(src, args=()):
+    """
+    :param src:         python source file
+    :param args:        extra mpy-cross arguments (e.g. -march=xtensawin)
+    :return:            hex digest identifying the compiled output
+    """
+
+    h = hashlib.sha256()
+
+    with open(src, "rb") as f:
+        h.update(f.read())
+
+    h.update(b"\0" + mpy_cross_version().encode("utf-8"))
+
+    for a in args:
+        h.update(b"\0" + a.encode("utf-8"))
+
+    # the source name ends up in the byte-code (tracebacks)
+    h.update(b"\0" + os.path.basename(src).encode("utf-8"))
+
+    return h.hexdigest()
+
+
+def compile_file(src, dst=None, args=(), cache=True):
+    """
+    Compile a python file with mpy-cross, reusing a cached result for
+    unchanged sources.
+
+    :param src:         python source file
+    :param dst:         output file, defaults to src with extension ".mpy"
+    :param args:        extra mpy-cross arguments
+    :param cache:       use the compile cache
+    :return:            True if the result came from the cache
+    """
+
+    if dst is None:
+        dst = mpy_name(src)
+
+    cached = None
+
+    if cache:
+        cached = os.path.join(CACHE_DIR, cache_key(src, args) + ".mpy")
+
+        if os.path.isfile(cached):
+            shutil.copyfile(cached, dst)
+            return True
+
+    cmd = ["mpy-cross"] + list(args) + ["-o", dst, src]
+
+    try:
+        return_code = subprocess.call(cmd)
+    except OSError as e:
+        raise IOError("mpy-cross not found: %s" % e)
+
+    if return_code != 0:
+        raise IOError("Failed to compile: %s" % src)
+
+    if cached is not None:
+        try:
+            os.makedirs(CACHE_DIR)
+        except OSError:
+            if not os.path.isdir(CACHE_DIR):
+                raise
+        # copy to a unique temporary name first, the worker threads of
+        # compile_tree may store the same entry at the same time
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR)
+        os.close(fd)
+        shutil.copyfile(dst, tmp)
+        os.rename(tmp, cached)
+
+    return False
+
+
+def find_sources(src_dir):
+    """
+    :return:            all python files below src_dir, except boot.py and main.py
+                        which MicroPython only runs as source
+    """
+
+    sources = []
+
+    for root, dirs, names in os.walk(src_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d != "__pycache__"]
+        for n in names:
+            if n.endswith(".py") and not (root == src_dir and n in ("boot.py", "main.py")):
+                sources.append(os.path.join(root, n))
+
+    return sorted(sources)
+
+
+def compile_tree(src_dir, args=(), jobs=None, verbose=False):
+    """
+    Compile all python files below src_dir in parallel. mpy-cross runs as
+    one process per file, at most "jobs" of them at a time.
+
+    :param src_dir:     local directory
+    :param args:        extra mpy-cross arguments
+    :param jobs:        number of parallel compilers, defaults to the number of cores
+    :return:            (number of files compiled, number of files taken from the cache)
+    """
+
+    import multiprocessing
+    from concurrent.futures import ThreadPoolExecutor
+
+    sources = find_sources(src_dir)
+
+    # query the version before starting workers, so it happens only once
+    mpy_cross_version()
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    compiled = 0
+    cached = 0
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+
+        for src, hit in zip(sources, pool.map(lambda s: compile_file(s, args=args), sources)):
+
+            if hit:
+                cached += 1
+            else:
+                compiled += 1
+
+            if verbose:
+                print(" * %s %s" % ("cached  " if hit else "compiled", src))
+
+    logging.info("mpy-cross: %d compiled, %d cached" % (compiled, cached))
+
+    return compiled, cached
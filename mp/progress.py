@@ -0,0 +1,144 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+
+import sys
+import time
+
+
+def _size(n):
+
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return "%.1f %s" % (n, unit)
+        n /= 1024.0
+
+    return "%.1f GB" % n
+
+
+class Progress(object):
+
+    # minimum time between two redraws of the bar
+    INTERVAL = 0.2
+
+    BAR_WIDTH = 20
+    NAME_WIDTH = 24
+
+    def __init__(self, stream=None, callback=None, interactive=None):
+        """
+        Report the progress of transfers. On a terminal a single line bar
+        with throughput and ETA is redrawn at most every INTERVAL seconds,
+        otherwise nothing is printed. The callback sees every update.
+
+        :param stream:      where the bar goes, defaults to sys.stdout
+        :param callback:    called as callback(name, done, total) on every update
+        :param interactive: force the bar on or off, defaults to stream being a tty
+        """
+
+        self.stream = stream
+        self.callback = callback
+        self.interactive = interactive
+        self.name = None
+        self.total = 0
+        self.done = 0
+        self.started = 0
+        self.drawn = 0
+
+    def __out(self):
+
+        return self.stream if self.stream is not None else sys.stdout
+
+    def __enabled(self):
+
+        if self.interactive is not None:
+            return self.interactive
+
+        isatty = getattr(self.__out(), "isatty", None)
+        return isatty is not None and isatty()
+
+    def __draw(self):
+
+        elapsed = time.time() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0
+        fill = self.BAR_WIDTH * self.done // self.total if self.total else self.BAR_WIDTH
+
+        if self.done >= self.total:
+            eta = "%5.1fs" % elapsed
+        elif rate:
+            eta = "ETA %ds" % ((self.total - self.done) / rate)
+        else:
+            eta = "ETA ?"
+
+        name = self.name
+        if len(name) > self.NAME_WIDTH:
+            name = "..." + name[-(self.NAME_WIDTH - 3):]
+
+        self.__out().write("\r * %-*s [%s%s] %3d%% %10s/s %-9s" % (
+            self.NAME_WIDTH, name, "#" * fill, "-" * (self.BAR_WIDTH - fill),
+            100 * self.done // self.total if self.total else 100, _size(rate), eta))
+        self.__out().flush()
+
+        self.drawn = time.time()
+
+    def start(self, name, total):
+        """
+        :param name:        what is transferred, e.g. the remote file name
+        :param total:       number of bytes to transfer
+        """
+
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.started = time.time()
+        self.drawn = 0
+
+        self.update(0)
+
+    def update(self, done):
+        """
+        :param done:        number of bytes transferred so far
+        """
+
+        self.done = done
+
+        if self.callback is not None:
+            self.callback(self.name, done, self.total)
+
+        if self.__enabled() and time.time() - self.drawn >= self.INTERVAL:
+            self.__draw()
+
+    def finish(self):
+        """
+        End the transfer, completing the line of the bar.
+        """
+
+        if self.name is None:
+            return
+
+        if self.__enabled():
+            self.__draw()
+            self.__out().write("\n")
+            self.__out().flush()
+
+        self.name = None
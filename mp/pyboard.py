@@ -6,7 +6,6 @@ Pyboard REPL interface
 
 import sys
 import time
-import serial
 
 try:
     stdout = sys.stdout.buffer
@@ -31,6 +30,10 @@ class Pyboard:
 
         self.con = conbase
 
+        # optional (escape byte, handler) pair, the handler is called with this
+        # board whenever the escape byte shows up in the output (see mp.mount)
+        self.intercept = None
+
     def close(self):
 
         if self.con is not None:
@@ -39,6 +42,9 @@ class Pyboard:
     def read_until(self, min_num_bytes, ending, timeout=10, data_consumer=None, max_recv=sys.maxsize):
 
         data = self.con.read(min_num_bytes)
+        while self.intercept is not None and data == self.intercept[0]:
+            self.intercept[1](self)
+            data = self.con.read(min_num_bytes)
         if data_consumer:
             data_consumer(data)
         timeout_count = 0
@@ -49,6 +55,10 @@ class Pyboard:
                 break
             elif self.con.inWaiting() > 0:
                 new_data = self.con.read(1)
+                if self.intercept is not None and new_data == self.intercept[0]:
+                    self.intercept[1](self)
+                    timeout_count = 0
+                    continue
                 data = data + new_data
                 if data_consumer:
                     data_consumer(new_data)
@@ -0,0 +1,208 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+import os
+import time
+import select
+import struct
+import logging
+
+
+def _ignored(name):
+    """
+    Skip hidden files, editor backups and byte-code caches.
+    """
+
+    return name.startswith(".") or name.endswith("~") or name.endswith(".swp") or name == "__pycache__"
+
+
+class _PollBackend(object):
+
+    def __init__(self, root, interval=0.5):
+
+        self.root = root
+        self.interval = interval
+        self.snapshot = self.__scan()
+
+    def __scan(self):
+
+        files = {}
+
+        for root, dirs, names in os.walk(self.root):
+
+            dirs[:] = [d for d in dirs if not _ignored(d)]
+
+            for n in names:
+                if not _ignored(n):
+                    path = os.path.join(root, n)
+                    try:
+                        st = os.stat(path)
+                        files[path] = (st.st_mtime, st.st_size)
+                    except OSError:
+                        pass
+
+        return files
+
+    def wait(self, timeout):
+
+        end = None if timeout is None else time.time() + timeout
+
+        while True:
+
+            current = self.__scan()
+            changed = set(p for p in current if self.snapshot.get(p) != current[p])
+            changed |= set(p for p in self.snapshot if p not in current)
+            self.snapshot = current
+
+            if len(changed) or (end is not None and time.time() >= end):
+                return changed
+
+            time.sleep(self.interval if end is None else max(0, min(self.interval, end - time.time())))
+
+    def close(self):
+        pass
+
+
+class _InotifyBackend(object):
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, root):
+
+        import ctypes
+        import ctypes.util
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK)
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.wds = {}
+
+        for path, dirs, _ in os.walk(root):
+            dirs[:] = [d for d in dirs if not _ignored(d)]
+            self.__add_watch(path)
+
+    def __add_watch(self, path):
+
+        wd = self.libc.inotify_add_watch(self.fd, path.encode("utf-8"), self.MASK)
+
+        if wd >= 0:
+            self.wds[wd] = path
+        else:
+            logging.warning("failed to watch: %s" % path)
+
+    def wait(self, timeout):
+
+        changed = set()
+
+        if not len(select.select([self.fd], [], [], timeout)[0]):
+            return changed
+
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except OSError:
+            return changed
+
+        pos = 0
+
+        while pos + 16 <= len(buf):
+
+            wd, mask, _, size = struct.unpack_from("iIII", buf, pos)
+            name = buf[pos + 16:pos + 16 + size].rstrip(b"\0").decode("utf-8")
+            pos += 16 + size
+
+            if wd not in self.wds or not len(name) or _ignored(name):
+                continue
+
+            path = os.path.join(self.wds[wd], name)
+
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self.__add_watch(path)
+                    # files may have been created before the watch was set up
+                    for root, dirs, names in os.walk(path):
+                        dirs[:] = [d for d in dirs if not _ignored(d)]
+                        changed |= set(os.path.join(root, n) for n in names if not _ignored(n))
+            else:
+                changed.add(path)
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher(object):
+
+    def __init__(self, root, debounce=0.3):
+        """
+        Watch a local directory tree for changed files. Uses inotify on Linux
+        and falls back to polling modification times everywhere else.
+
+        :param root:        local directory to watch
+        :param debounce:    quiet period in seconds which ends a burst of changes
+        """
+
+        self.root = root
+        self.debounce = debounce
+
+        try:
+            self.backend = _InotifyBackend(root)
+        except (OSError, AttributeError, TypeError) as e:
+            logging.info("inotify not available, polling instead: %s" % e)
+            self.backend = _PollBackend(root)
+
+    def changes(self, timeout=None):
+        """
+        Wait for changes and coalesce bursts (e.g. several saves in a row).
+
+        :param timeout:     seconds to wait for the first change, None for ever
+        :return:            sorted list of changed files (relative to root) which still exist
+        """
+
+        changed = self.backend.wait(timeout)
+
+        if not len(changed):
+            return []
+
+        while True:
+            more = self.backend.wait(self.debounce)
+            if not len(more):
+                break
+            changed |= more
+
+        return sorted(os.path.relpath(p, self.root) for p in changed if os.path.isfile(p))
+
+    def close(self):
+        self.backend.close()